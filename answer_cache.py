@@ -0,0 +1,121 @@
+# answer_cache.py
+import logging
+from collections import OrderedDict
+import numpy as np
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("SemanticAnswerCache")
+
+class SemanticAnswerCache:
+    """Per-user LRU cache of answers keyed by question embedding.
+
+    A lookup hits when a cached question's embedding has cosine similarity at or
+    above the threshold. Identical question text hits without needing an embedding.
+    Each answer carries a stamp of the index it was generated from; once lookups pass
+    a different stamp (another worker refreshed the index), older answers are dropped.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        # normalized question -> (unit embedding, answer, index stamp), least recently used first
+        self._entries = OrderedDict()
+        self.stamp = None
+        self._keys = []
+        self._matrix = None
+
+    @staticmethod
+    def _normalize_question(question):
+        return " ".join(question.lower().split())
+
+    def _expire(self, stamp):
+        """Drop answers generated from another version of the index."""
+        if stamp == self.stamp:
+            return
+        stale = [key for key, entry in self._entries.items() if entry[2] != stamp]
+        if stale:
+            logger.info(f"Index changed, dropping {len(stale)} cached answers")
+            for key in stale:
+                del self._entries[key]
+            self._matrix = None
+        self.stamp = stamp
+
+    def lookup_text(self, question, stamp=None):
+        """Return the cached answer for an identical question, or None."""
+        self._expire(stamp)
+        key = self._normalize_question(question)
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        logger.info("Answer cache hit (exact question)")
+        return self._entries[key][1]
+
+    def lookup(self, embedding, stamp=None):
+        """Return the answer of the most similar cached question above the threshold, or None."""
+        self._expire(stamp)
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = self._matrix @ query
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        key = self._keys[best]
+        self._entries.move_to_end(key)
+        self.hits += 1
+        logger.info(f"Answer cache hit (similarity {similarities[best]:.3f})")
+        return self._entries[key][1]
+
+    def put(self, question, embedding, answer, stamp=None):
+        """Cache an answer generated from the index at ``stamp``, evicting the least recently used entry when full."""
+        if self._entries and stamp != self.stamp:
+            # The index changed while this answer was being generated
+            return
+        self.stamp = stamp
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = self._normalize_question(question)
+        self._entries[key] = (vector, answer, stamp)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the user's index changed."""
+        if self._entries:
+            logger.info(f"Invalidating {len(self._entries)} cached answers")
+        self._entries.clear()
+        self._keys = []
+        self._matrix = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
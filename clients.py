@@ -0,0 +1,121 @@
+# clients.py
+import logging
+import aiohttp
+import httpx
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.cosmos.aio import CosmosClient
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient as AsyncSearchIndexClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    COSMOS_ENDPOINT,
+    COSMOS_KEY,
+    SEARCH_SERVICE_ENDPOINT,
+    SEARCH_SERVICE_KEY,
+    SEARCH_MAX_CONNECTIONS
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Clients")
+
+# Shared upstream clients, created lazily and reused across all users
+_openai_client = None
+_cosmos_client = None
+_async_search_index_client = None
+_async_search_session = None
+_async_search_transport = None
+
+def get_openai_client():
+    """Return the shared AsyncOpenAI client backed by a single connection pool.
+
+    The client does not retry on its own; callers retry through deadline.with_retries.
+    """
+    global _openai_client
+    if _openai_client is None:
+        logger.info(f"Creating shared AsyncOpenAI client (max connections: {OPENAI_MAX_CONNECTIONS})")
+        _openai_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                )
+            )
+        )
+    return _openai_client
+
+def get_cosmos_client():
+    """Return the shared async Cosmos DB client."""
+    global _cosmos_client
+    if _cosmos_client is None:
+        logger.info("Creating shared Cosmos DB client")
+        _cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+    return _cosmos_client
+
+def _get_async_search_transport():
+    """Return the pooled aiohttp transport shared by every async Azure Search client.
+
+    Must be called from a running event loop.
+    """
+    global _async_search_session, _async_search_transport
+    if _async_search_transport is None:
+        logger.info(f"Creating shared async Azure Search transport (max connections: {SEARCH_MAX_CONNECTIONS})")
+        _async_search_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=SEARCH_MAX_CONNECTIONS),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False
+        )
+        _async_search_transport = AioHttpTransport(session=_async_search_session, session_owner=False)
+    return _async_search_transport
+
+def get_async_search_index_client():
+    """Return the shared async index client for creating and deleting indexes."""
+    global _async_search_index_client
+    if _async_search_index_client is None:
+        _async_search_index_client = AsyncSearchIndexClient(
+            endpoint=SEARCH_SERVICE_ENDPOINT,
+            credential=AzureKeyCredential(SEARCH_SERVICE_KEY),
+            transport=_get_async_search_transport(),
+            retry_total=0  # Retried by deadline.with_retries
+        )
+    return _async_search_index_client
+
+def get_search_client(index_name):
+    """Return an async SearchClient for one index that reuses the shared connection pool.
+
+    The SDK's own retries are off: searches retry within the query deadline and uploads retry per batch.
+    """
+    return SearchClient(
+        endpoint=SEARCH_SERVICE_ENDPOINT,
+        credential=AzureKeyCredential(SEARCH_SERVICE_KEY),
+        index_name=index_name,
+        transport=_get_async_search_transport(),
+        retry_total=0
+    )
+
+async def close_clients():
+    """Close shared clients and release their connection pools."""
+    global _openai_client, _cosmos_client
+    global _async_search_index_client, _async_search_session, _async_search_transport
+    if _openai_client is not None:
+        logger.info("Closing shared AsyncOpenAI client")
+        await _openai_client.close()
+        _openai_client = None
+    if _async_search_session is not None:
+        logger.info("Closing shared async Azure Search connection pool")
+        await _async_search_session.close()
+        _async_search_session = None
+        _async_search_transport = None
+        _async_search_index_client = None
+    if _cosmos_client is not None:
+        logger.info("Closing shared Cosmos DB client")
+        await _cosmos_client.close()
+        _cosmos_client = None
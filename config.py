@@ -9,13 +9,77 @@ COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
 COSMOS_KEY = os.getenv("COSMOS_KEY")
 COSMOS_DATABASE = os.getenv("COSMOS_DATABASE")
 COSMOS_CONTAINER = os.getenv("COSMOS_CONTAINER")
+COSMOS_PAGE_SIZE = int(os.getenv("COSMOS_PAGE_SIZE", "10"))  # Inventory documents fetched per query page
 
 # OpenAI configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "ft:gpt-4o-2024-08-06:culvana::B4wUeDCH"  # or your preferred model
 OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))  # e.g. 256/512/1536; indexes with other dimensions are rebuilt
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))  # Shared connection pool size
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "8191"))  # Embedding model input limit
+COMPLETION_MAX_TOKENS = int(os.getenv("COMPLETION_MAX_TOKENS", "1000"))  # Longest answer generated
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1200"))  # Budget for retrieved items and totals in the prompt
+
+# OpenAI rate limits per model, used until response headers report the account's actual limits
+CHAT_REQUESTS_PER_MINUTE = int(os.getenv("CHAT_REQUESTS_PER_MINUTE", "500"))
+CHAT_TOKENS_PER_MINUTE = int(os.getenv("CHAT_TOKENS_PER_MINUTE", "30000"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+RATE_LIMIT_INTERACTIVE_RESERVE = float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.2"))  # Share of each budget background indexing leaves for queries
+
+# Time budgets and retries for upstream calls
+QUERY_DEADLINE_SECONDS = float(os.getenv("QUERY_DEADLINE_SECONDS", "20"))  # End-to-end budget of a query (to the first token when streaming)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # Attempts per upstream call, including the first
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))  # Backoff before the first retry, doubled after each
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "8"))  # Longest backoff between attempts
+
+# Embedding batching configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))  # Inputs per embeddings request
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))  # Batches in flight at once
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # Batches buffered between ingestion stages
+
+# Embedding cache configuration
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Semantic answer cache configuration
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))  # Cached answers per user
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))  # Minimum cosine similarity for a hit
+
+# Assistant registry configuration
+MAX_RESIDENT_ASSISTANTS = int(os.getenv("MAX_RESIDENT_ASSISTANTS", "500"))  # Assistants kept in memory at once
+ASSISTANT_IDLE_TTL_SECONDS = int(os.getenv("ASSISTANT_IDLE_TTL_SECONDS", "1800"))  # Evict tenants idle this long
+ASSISTANT_SWEEP_INTERVAL_SECONDS = int(os.getenv("ASSISTANT_SWEEP_INTERVAL_SECONDS", "60"))
+
+# Retrieval configuration
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # Combine keyword (BM25) and vector search
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "20"))  # Items retrieved for local re-ranking
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "3"))  # Items passed to the prompt after re-ranking
+RRF_K = int(os.getenv("RRF_K", "60"))  # Reciprocal rank fusion constant
+
+# Vector store backend: "azure" (Azure Cognitive Search) or "local" (in-process NumPy index)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "azure")
+LOCAL_HNSW_MIN_ITEMS = int(os.getenv("LOCAL_HNSW_MIN_ITEMS", "20000"))  # Use an HNSW graph (if hnswlib is installed) above this size
+
+# Memory-mapped vector snapshots per index, shared across workers through the OS page cache
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "vector_snapshots")
+VECTOR_SNAPSHOT_DTYPE = os.getenv("VECTOR_SNAPSHOT_DTYPE", "float32")  # "float32" or "float16" (half the disk and page cache)
+SEARCH_FROM_SNAPSHOT = os.getenv("SEARCH_FROM_SNAPSHOT", "false").lower() == "true"  # Serve Azure-backed queries from the local snapshot
+
+# Quantized vector scans for local search: "none", "int8" or "binary", re-ranked at full precision
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATION_RERANK_FACTOR = int(os.getenv("QUANTIZATION_RERANK_FACTOR", "8"))  # Candidates re-ranked per requested result
 
 # Azure Cognitive Search configuration
 SEARCH_SERVICE_ENDPOINT = os.getenv("SEARCH_SERVICE_ENDPOINT")
 SEARCH_SERVICE_KEY = os.getenv("SEARCH_SERVICE_KEY")
-SEARCH_INDEX_NAME = os.getenv("SEARCH_INDEX_NAME")
\ No newline at end of file
+SEARCH_INDEX_NAME = os.getenv("SEARCH_INDEX_NAME")
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "50"))  # Shared connection pool size
+SEARCH_UPLOAD_MAX_BYTES = int(os.getenv("SEARCH_UPLOAD_MAX_BYTES", str(8 * 1024 * 1024)))  # Serialized payload per upload request (service limit is 16 MB)
+SEARCH_UPLOAD_MAX_DOCUMENTS = int(os.getenv("SEARCH_UPLOAD_MAX_DOCUMENTS", "1000"))  # Documents per upload request (service limit)
+SEARCH_UPLOAD_CONCURRENCY = int(os.getenv("SEARCH_UPLOAD_CONCURRENCY", "4"))  # Upload requests in flight per index
+SEARCH_UPLOAD_MAX_RETRIES = int(os.getenv("SEARCH_UPLOAD_MAX_RETRIES", "3"))  # Retries of documents that failed to index
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "index_snapshots")  # Local record of indexed documents per user
+INDEX_CATALOG_TTL_SECONDS = int(os.getenv("INDEX_CATALOG_TTL_SECONDS", "60"))  # How long cached index existence is trusted
+INDEX_GC_GRACE_SECONDS = int(os.getenv("INDEX_GC_GRACE_SECONDS", "300"))  # Keep retired index versions this long after a swap
\ No newline at end of file
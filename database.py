@@ -1,32 +1,83 @@
 # database.py
-from azure.cosmos import CosmosClient, PartitionKey
+import logging
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from clients import get_cosmos_client
 from config import (
-    COSMOS_ENDPOINT,
-    COSMOS_KEY,
     COSMOS_DATABASE,
-    COSMOS_CONTAINER
+    COSMOS_CONTAINER,
+    COSMOS_PAGE_SIZE
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("CosmosDB")
+
+# Item fields read by the indexer; everything else on the stored items is left on the server
+INVENTORY_ITEM_FIELDS = [
+    "Supplier Name",
+    "Inventory Item Name",
+    "Item Name",
+    "Brand",
+    "Item Number",
+    "Quantity In a Case",
+    "Total Units",
+    "Case Price",
+    "Cost of a Unit",
+    "Category",
+    "Measured In",
+    "Catch Weight",
+    "Priced By",
+    "Splitable"
+]
+
+# Inventory documents in the user's partition, with each item projected to the indexed fields
+INVENTORY_QUERY = (
+    "SELECT c.id, c.userId, ARRAY(SELECT VALUE {"
+    + ", ".join(f'"{field}": i["{field}"]' for field in INVENTORY_ITEM_FIELDS)
+    + "} FROM i IN c.items) AS items FROM c WHERE c.userId = @userId"
 )
 
 class CosmosDB:
     def __init__(self):
-        self.client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+        self.client = get_cosmos_client()
         self.database = self.client.get_database_client(COSMOS_DATABASE)
         self.container = self.database.get_container_client(COSMOS_CONTAINER)
 
+    async def iter_user_document_pages(self, user_id, continuation_token=None):
+        """Yield (documents, continuation_token) for each page of the user's inventory documents.
+
+        The query is parameterized and scoped to the user's partition; pass a yielded token back
+        in to resume after that page.
+        """
+        pages = self.container.query_items(
+            query=INVENTORY_QUERY,
+            parameters=[{"name": "@userId", "value": user_id}],
+            partition_key=user_id,
+            max_item_count=COSMOS_PAGE_SIZE
+        ).by_page(continuation_token)
+        page_number = 0
+        async for page in pages:
+            documents = [document async for document in page]
+            page_number += 1
+            logger.info(f"Fetched page {page_number} with {len(documents)} inventory documents for user {user_id}")
+            yield documents, pages.continuation_token
+
+    async def iter_user_documents(self, user_id):
+        """Yield the user's inventory documents as their pages arrive."""
+        async for documents, _ in self.iter_user_document_pages(user_id):
+            for document in documents:
+                yield document
+
     async def get_user_documents(self, user_id):
         # Query documents for specific user
-        query = f"SELECT * FROM c WHERE c.userId = '{user_id}'"
-        items = list(self.container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        return items
+        return [document async for document in self.iter_user_documents(user_id)]
 
     async def get_user_info(self, user_id):
-        # Get specific user details
-        query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-        items = list(self.container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        return items[0] if items else None
\ No newline at end of file
+        # Get specific user details with a point read on the user's partition
+        try:
+            return await self.container.read_item(item=user_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            return None
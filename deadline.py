@@ -0,0 +1,103 @@
+# deadline.py
+import asyncio
+import contextvars
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+import openai
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Deadline")
+
+# Monotonic time by which the current request must finish; None outside a request
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+# HTTP statuses worth another attempt
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Retries and expired deadlines per operation, for /metrics
+_retries = Counter()
+_expired = Counter()
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before its work finished."""
+
+@contextmanager
+def deadline_after(seconds):
+    """Give the enclosed work, and every task it starts, ``seconds`` to finish.
+
+    A nested deadline can only shorten the one already in force.
+    """
+    previous = _deadline.get()
+    expires = time.monotonic() + seconds
+    _deadline.set(expires if previous is None else min(previous, expires))
+    try:
+        yield
+    finally:
+        # Set rather than reset: an async generator may be closed from another context
+        _deadline.set(previous)
+
+def remaining():
+    """Seconds left before the current deadline, or None if there is none."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+def expired(operation, detail=""):
+    """Count an expired deadline and return the exception to raise."""
+    _expired[operation] += 1
+    return DeadlineExceeded(f"Deadline exceeded during {operation}{': ' + detail if detail else ''}")
+
+def record_retry(operation):
+    _retries[operation] += 1
+
+def retry_stats():
+    return {"retries": dict(_retries), "deadline_exceeded": dict(_expired)}
+
+def is_retryable(error):
+    """True for errors a later attempt may not hit: connection failures, throttling and server errors."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+async def with_retries(operation, name, attempts=RETRY_MAX_ATTEMPTS):
+    """Await ``operation()``, retrying transient errors with exponential backoff.
+
+    Each attempt is cut off at the current deadline, and a retry is only made if its backoff
+    leaves time before the deadline. This is the one retry layer for upstream calls, so every
+    retry is counted here under ``name``.
+    """
+    for attempt in range(1, attempts + 1):
+        left = remaining()
+        if left is not None and left <= 0:
+            raise expired(name)
+        try:
+            if left is None:
+                return await operation()
+            return await asyncio.wait_for(operation(), left)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and left is not None and remaining() <= 0:
+                raise expired(name, f"no response after {left:.1f}s") from None
+            if attempt == attempts or not is_retryable(e):
+                raise
+            delay = min(RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1), RETRY_MAX_DELAY_SECONDS)
+            left = remaining()
+            if left is not None and delay >= left:
+                raise expired(name, f"no time left to retry {type(e).__name__}") from e
+            record_retry(name)
+            logger.warning(f"{name} failed (attempt {attempt}/{attempts}), retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
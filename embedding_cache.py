@@ -0,0 +1,168 @@
+# embedding_cache.py
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from config import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_BYTES
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("EmbeddingCache")
+
+class EmbeddingCache:
+    """Persistent SQLite cache of embeddings keyed by (model, content hash) with LRU eviction."""
+
+    # SQLite limits the number of bound parameters per statement
+    LOOKUP_CHUNK_SIZE = 500
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        logger.info(f"Opening embedding cache at {path} (max size: {max_bytes} bytes)")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache holds {self.total_bytes} bytes")
+
+    @staticmethod
+    def content_hash(text):
+        """Hash content text for use as a cache key."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Look up embeddings for texts, returning a list aligned with texts (None on miss)."""
+        hashes = [self.content_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            for start in range(0, len(hashes), self.LOOKUP_CHUNK_SIZE):
+                chunk = hashes[start:start + self.LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *chunk]
+                ).fetchall()
+                for content_hash, vector in rows:
+                    found[content_hash] = np.frombuffer(vector, dtype=np.float32)
+
+                # Touch hits so eviction drops the least recently used entries first
+                hit_hashes = [(now, model, h) for h in chunk if h in found]
+                if hit_hashes:
+                    self.conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND content_hash = ?",
+                        hit_hashes
+                    )
+            self.conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model, texts, embeddings):
+        """Store embeddings for texts and evict least recently used entries over the size cap."""
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            vector = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((model, self.content_hash(text), vector, len(vector), now))
+
+        if not rows:
+            return
+
+        with self._lock:
+            for model_name, content_hash, vector, size, last_access in rows:
+                previous = self.conn.execute(
+                    "SELECT size FROM embeddings WHERE model = ? AND content_hash = ?",
+                    (model_name, content_hash)
+                ).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, content_hash, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (model_name, content_hash, vector, size, last_access)
+                )
+                self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        excess = self.total_bytes - self.max_bytes
+        victims = []
+        freed = 0
+        for rowid, size in self.conn.execute("SELECT rowid, size FROM embeddings ORDER BY last_access"):
+            victims.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+
+        self.conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+        self.total_bytes -= freed
+        self.evictions += len(victims)
+        logger.info(f"Evicted {len(victims)} embeddings ({freed} bytes) from cache")
+
+    async def aget_many(self, model, texts):
+        """Async wrapper around get_many that keeps disk I/O off the event loop."""
+        return await asyncio.to_thread(self.get_many, model, texts)
+
+    async def aput_many(self, model, texts, embeddings):
+        """Async wrapper around put_many that keeps disk I/O off the event loop."""
+        return await asyncio.to_thread(self.put_many, model, texts, embeddings)
+
+    def stats(self):
+        """Return hit/miss counters and current cache size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+# Shared cache instance, created lazily and reused across all users
+_embedding_cache = None
+
+def get_embedding_cache():
+    """Return the shared embedding cache."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -1,12 +1,20 @@
 # embeddings.py
+import asyncio
+import base64
 import logging
-from openai import OpenAI
+from clients import get_openai_client
+from embedding_cache import get_embedding_cache
 from config import (
-    OPENAI_API_KEY,
-    OPENAI_EMBEDDING_MODEL
+    OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_TOKENS
 )
+from token_budget import count_tokens, truncate_tokens
+from rate_limiter import create_with_limits, INTERACTIVE, BACKGROUND
+from deadline import with_retries
 import numpy as np
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 # Set up logging
 logging.basicConfig(
@@ -15,18 +23,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger("EmbeddingGenerator")
 
+def decode_embedding(data):
+    """View a base64-encoded embedding as a float32 array, without parsing any floats."""
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
 class EmbeddingGenerator:
-    # Expected dimensions for different OpenAI embedding models
+    # Native dimensions for different OpenAI embedding models
     EXPECTED_DIMENSIONS = {
         "text-embedding-3-small": 1536,
         "text-embedding-3-large": 3072, 
         "text-embedding-ada-002": 1536  # Legacy model
     }
+    # Models that accept the dimensions parameter to return shortened embeddings
+    SHORTENABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
 
-    def __init__(self):
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS):
         logger.info(f"Initializing EmbeddingGenerator with model: {OPENAI_EMBEDDING_MODEL}")
         
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = get_openai_client()
+        self.cache = get_embedding_cache()
         
         if OPENAI_EMBEDDING_MODEL not in self.EXPECTED_DIMENSIONS:
             error_msg = (
@@ -36,12 +51,26 @@ class EmbeddingGenerator:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        self.expected_dim = self.EXPECTED_DIMENSIONS[OPENAI_EMBEDDING_MODEL]
+        native_dim = self.EXPECTED_DIMENSIONS[OPENAI_EMBEDDING_MODEL]
+        if dimensions != native_dim and (
+            OPENAI_EMBEDDING_MODEL not in self.SHORTENABLE_MODELS or not 0 < dimensions < native_dim
+        ):
+            error_msg = (
+                f"Unsupported embedding dimensions {dimensions} for {OPENAI_EMBEDDING_MODEL} "
+                f"(native dimensions: {native_dim})"
+            )
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        
+        self.expected_dim = dimensions
+        # Only shortened embeddings send the parameter, so native requests stay valid for every model
+        self.request_params = {"dimensions": dimensions} if dimensions != native_dim else {}
+        # Shortened embeddings are cached separately from full-size ones
+        self.cache_model = OPENAI_EMBEDDING_MODEL if dimensions == native_dim else f"{OPENAI_EMBEDDING_MODEL}:{dimensions}"
         logger.info(f"Expected dimensions for {OPENAI_EMBEDDING_MODEL}: {self.expected_dim}")
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def generate_embedding(self, text):
-        """Generate embedding with improved error handling and retries."""
+    def _prepare_text(self, text):
+        """Validate input text and truncate it to the API limit."""
         if not text:
             logger.error("Cannot generate embedding for empty text")
             raise ValueError("Text cannot be empty")
@@ -50,23 +79,36 @@ class EmbeddingGenerator:
             logger.error(f"Expected string input, got {type(text)}")
             raise TypeError(f"Expected string input, got {type(text)}")
             
-        # Truncate text if it's too long (OpenAI API has token limits)
-        if len(text) > 8000:
-            logger.warning(f"Text too long ({len(text)} chars), truncating to 8000 chars")
-            text = text[:8000]
+        # Truncate text at the model's token limit
+        text, truncated = truncate_tokens(text, EMBEDDING_MAX_TOKENS, OPENAI_EMBEDDING_MODEL)
+        if truncated:
+            logger.warning(f"Text too long, truncated to {EMBEDDING_MAX_TOKENS} tokens")
+        
+        return text
+
+    async def generate_embedding(self, text, priority=INTERACTIVE):
+        """Generate embedding with improved error handling; transient API errors are retried within the deadline."""
+        text = self._prepare_text(text)
         
         try:
             logger.info(f"Generating embedding for text (length: {len(text)})")
             
-            # Generate embedding
-            response = self.client.embeddings.create(
-                input=text,
-                model=OPENAI_EMBEDDING_MODEL,
-                encoding_format="float"
+            # Generate embedding; base64 transport skips parsing thousands of JSON floats
+            response = await with_retries(
+                lambda: create_with_limits(
+                    self.client.embeddings,
+                    OPENAI_EMBEDDING_MODEL,
+                    count_tokens(text, OPENAI_EMBEDDING_MODEL),
+                    priority,
+                    input=text,
+                    encoding_format="base64",
+                    **self.request_params
+                ),
+                "embedding"
             )
             
             # Extract embedding
-            embedding = response.data[0].embedding
+            embedding = decode_embedding(response.data[0].embedding)
             actual_dim = len(embedding)
             
             logger.info(f"Generated embedding with dimensions: {actual_dim}")
@@ -91,25 +133,116 @@ class EmbeddingGenerator:
             logger.error(error_msg)
             raise
 
+    async def generate_embeddings(self, texts, batch_size=EMBEDDING_BATCH_SIZE, max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                                  priority=BACKGROUND):
+        """Generate embeddings for many texts with batched, concurrent requests.
+
+        Returns a list of float32 arrays aligned with ``texts``. Items that fail inside a batch are
+        retried on their own; items that still fail are returned as None. Bulk work runs at
+        background priority, behind interactive queries for the shared rate limits.
+        """
+        if not texts:
+            return []
+        
+        results = [None] * len(texts)
+        prepared = {}
+        for i, text in enumerate(texts):
+            try:
+                prepared[i] = self._prepare_text(text)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Skipping text {i}: {str(e)}")
+        
+        # Serve unchanged content from the cache before calling the API
+        cached = await self.cache.aget_many(self.cache_model, list(prepared.values()))
+        for i, embedding in zip(list(prepared.keys()), cached):
+            if embedding is not None:
+                results[i] = embedding
+                del prepared[i]
+        logger.info(f"Embedding cache: {len(cached) - len(prepared)} hits, {len(prepared)} misses")
+        
+        indices = list(prepared.keys())
+        batch_size = max(1, batch_size)
+        batches = [indices[start:start + batch_size] for start in range(0, len(indices), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        logger.info(
+            f"Generating {len(indices)} embeddings in {len(batches)} batches "
+            f"(batch size: {batch_size}, max concurrency: {max_concurrency})"
+        )
+
+        async def run_batch(batch_number, batch_indices):
+            async with semaphore:
+                try:
+                    embeddings = await self._embed_batch([prepared[i] for i in batch_indices], priority)
+                except Exception as e:
+                    logger.error(f"Error embedding batch {batch_number}: {str(e)}, retrying items individually")
+                    embeddings = [None] * len(batch_indices)
+            
+            failed = []
+            for i, embedding in zip(batch_indices, embeddings):
+                try:
+                    if embedding is None:
+                        raise ValueError("No embedding returned")
+                    self._validate_embedding(embedding)
+                    results[i] = embedding
+                except ValueError as e:
+                    logger.warning(f"Embedding for text {i} failed in batch {batch_number}: {str(e)}")
+                    failed.append(i)
+            
+            # Retry failed items on their own rather than resubmitting the whole batch
+            for i in failed:
+                async with semaphore:
+                    try:
+                        results[i] = await self.generate_embedding(prepared[i], priority)
+                    except Exception as e:
+                        logger.error(f"Giving up on embedding for text {i}: {str(e)}")
+
+        await asyncio.gather(*(run_batch(n, batch) for n, batch in enumerate(batches, 1)))
+        
+        await self.cache.aput_many(
+            self.cache_model,
+            [prepared[i] for i in indices],
+            [results[i] for i in indices]
+        )
+        
+        succeeded = sum(1 for embedding in results if embedding is not None)
+        logger.info(f"Generated {succeeded}/{len(texts)} embeddings")
+        return results
+
+    async def _embed_batch(self, texts, priority=BACKGROUND):
+        """Embed a list of texts in a single request, preserving input order."""
+        response = await with_retries(
+            lambda: create_with_limits(
+                self.client.embeddings,
+                OPENAI_EMBEDDING_MODEL,
+                sum(count_tokens(text, OPENAI_EMBEDDING_MODEL) for text in texts),
+                priority,
+                input=texts,
+                encoding_format="base64",
+                **self.request_params
+            ),
+            "embedding_batch"
+        )
+        
+        embeddings = [None] * len(texts)
+        for data in response.data:
+            embeddings[data.index] = decode_embedding(data.embedding)
+        return embeddings
+
     def _validate_embedding(self, embedding):
-        """Validate embedding structure and values."""
-        if not isinstance(embedding, list):
-            raise ValueError(f"Embedding must be a list, got {type(embedding)}")
+        """Validate embedding structure and values, one vectorized pass per check."""
+        if not isinstance(embedding, np.ndarray) or embedding.dtype != np.float32:
+            raise ValueError(f"Embedding must be a float32 array, got {type(embedding)}")
             
-        if len(embedding) != self.expected_dim:
+        if embedding.shape != (self.expected_dim,):
             raise ValueError(
-                f"Invalid embedding dimensions. Expected {self.expected_dim}, got {len(embedding)}"
+                f"Invalid embedding dimensions. Expected {self.expected_dim}, got {embedding.shape}"
             )
             
-        if not all(isinstance(x, float) for x in embedding):
-            raise ValueError("All embedding values must be floats")
-            
         # Check for NaN or infinity values
-        if any(not np.isfinite(x) for x in embedding):
+        if not np.isfinite(embedding).all():
             raise ValueError("Embedding contains NaN or infinity values")
             
         # Check if embedding is all zeros
-        if all(x == 0 for x in embedding):
-            raise ValueError("Invalid embedding: all values are zero")
-            
-        logger.info("Embedding validation successful")
\ No newline at end of file
+        if not embedding.any():
+            raise ValueError("Invalid embedding: all values are zero")
\ No newline at end of file
@@ -0,0 +1,195 @@
+# fast_path.py
+import logging
+import re
+import numpy as np
+from query_parser import match_vocabulary, match_categories
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("FastPath")
+
+# Lookup and aggregate intents answered from the inventory table without a completion
+CASE_PRICE_PATTERN = re.compile(
+    r"\b(case price|price (?:of|for) (?:a|one) case|cost of (?:a|one) case|how much (?:is|does|do|for) (?:a|one) case|per case)\b"
+)
+UNIT_COST_PATTERN = re.compile(
+    r"\b(unit (?:cost|price)|(?:cost|price) (?:per|of a|of one) unit|per unit|how much is (?:one|each|a single))\b"
+)
+TOTAL_UNITS_PATTERN = re.compile(r"\b(total units|how many units|units (?:do i have|in stock|available|on hand))\b")
+ITEM_COUNT_PATTERN = re.compile(r"\bhow many (?:different )?(?:items|products)\b")
+INVENTORY_VALUE_PATTERN = re.compile(r"\b(inventory value|value of (?:my )?(?:inventory|stock)|total value|worth)\b")
+SUPPLIER_SPEND_PATTERN = re.compile(r"\b(spend|spending|spent)\b")
+CHEAPEST_PATTERN = re.compile(r"\b(cheapest|least expensive)\b")
+MOST_EXPENSIVE_PATTERN = re.compile(r"\b(most expensive|priciest)\b")
+
+# Questions that need reasoning are left to the model
+LLM_ONLY_PATTERN = re.compile(
+    r"\b(why|should|recommend|compare|trend|lowest|highest|best|worst|suggest|forecast)\b"
+)
+
+# Answers describe the table as it is now, so periods and what-ifs go to the model
+TIME_OR_HYPOTHETICAL_PATTERN = re.compile(
+    r"\b(last|past|previous|next|since|ago|yesterday|today|tomorrow|weeks?|months?|quarters?|years?|"
+    r"daily|weekly|monthly|yearly|annual(?:ly)?|if|would|could|suppose|assuming|double|triple|halve)\b"
+)
+
+ITEM_NUMBER_PATTERN = re.compile(r"(?:#|\bitem (?:number |no\.? |#)?)([a-z0-9-]{3,})\b")
+
+# Words that carry a question's intent or grammar rather than naming what it is about
+FUNCTION_WORDS = frozenset("""
+    a an the of for in on at from with by to my our i we me you your is are be it s what which how much many
+    do does did have has got there any all total number different item items product products unit units
+    price prices priced cost costs case cases per each one single inventory stock value worth spend spending
+    spent cheapest least most expensive priciest available hand currently current now tell show give please
+""".split())
+
+def _question_tokens(text):
+    return re.findall(r"[a-z0-9]+", text)
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+def _uncovered_words(text, *phrases):
+    """Words of the question explained by neither its intent nor the matched category, supplier or item.
+
+    A template answer is only safe when this is empty; leftover words ("cheese", "excluding")
+    narrow or change the question in ways the template would ignore.
+    """
+    covered = {_stem(word) for word in FUNCTION_WORDS}
+    for phrase in phrases:
+        if phrase:
+            covered.update(_stem(word) for word in _question_tokens(str(phrase).lower()))
+    return [word for word in _question_tokens(text) if _stem(word) not in covered]
+
+def _format_amount(value):
+    return f"{value:,.2f}"
+
+def _format_quantity(value):
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+def _resolve_item(text, table):
+    """The single item a question refers to by item number or full name, or None."""
+    for item_number in ITEM_NUMBER_PATTERN.findall(text):
+        matches = table.find_by_item_number(item_number)
+        if len(matches) == 1:
+            return matches[0]
+
+    matches = table.find_by_name(_question_tokens(text))
+    if len(matches) > 1:
+        suppliers = match_vocabulary(text, table.values('supplier_name'))
+        if suppliers:
+            matches = [item for item in matches if item.get('supplier_name') == suppliers[0]]
+    return matches[0] if len(matches) == 1 else None
+
+def answer_directly(question, table):
+    """Answer a lookup or aggregate question from the inventory table, or return None for the LLM path."""
+    if table is None or not len(table):
+        return None
+
+    text = " ".join(question.lower().split())
+    if LLM_ONLY_PATTERN.search(text) or TIME_OR_HYPOTHETICAL_PATTERN.search(text):
+        return None
+
+    categories = match_categories(text, table.values('category'))
+    suppliers = match_vocabulary(text, table.values('supplier_name'))
+    category = categories[0] if categories else None
+    supplier = suppliers[0] if suppliers else None
+
+    # Price extremes, optionally within a category and/or supplier
+    largest = bool(MOST_EXPENSIVE_PATTERN.search(text))
+    if largest or CHEAPEST_PATTERN.search(text):
+        if _uncovered_words(text, category, supplier):
+            return None
+        rows = None
+        for field, value in (("category", category), ("supplier_name", supplier)):
+            if value:
+                matching = table.rows_where(field, value)
+                rows = matching if rows is None else np.intersect1d(rows, matching)
+        price_field = "cost_of_unit" if UNIT_COST_PATTERN.search(text) else "case_price"
+        item = table.extreme(price_field, largest=largest, rows=rows)
+        if item is None:
+            return None
+        scope = " ".join(value for value in (supplier, category) if value)
+        label = "unit cost" if price_field == "cost_of_unit" else "case price"
+        logger.info(f"Fast path: {'highest' if largest else 'lowest'} {label} in {scope or 'inventory'}")
+        return (
+            f"Your {'most expensive' if largest else 'cheapest'} {scope + ' ' if scope else ''}item by {label} is "
+            f"{item['inventory_item_name'] or item['item_name']} from {item['supplier_name']} "
+            f"at ${_format_amount(item[price_field])}."
+        )
+
+    aggregates = table.aggregates
+    if supplier and SUPPLIER_SPEND_PATTERN.search(text):
+        if _uncovered_words(text, category, supplier) or category:
+            return None
+        group = aggregates["by_supplier"][supplier]
+        logger.info(f"Fast path: inventory value from {supplier}")
+        return (
+            f"You hold ${_format_amount(group['inventory_value'])} of inventory from {supplier} "
+            f"across {group['items']} items."
+        )
+
+    item = _resolve_item(text, table)
+    if item is not None:
+        if _uncovered_words(
+            text, item.get('inventory_item_name'), item.get('item_name'), item.get('item_number'),
+            item.get('supplier_name'), item.get('category'), item.get('measured_in')
+        ):
+            return None
+        name = item.get('inventory_item_name') or item.get('item_name')
+        supplier = f" from {item['supplier_name']}" if item.get('supplier_name') else ""
+        measured_in = item.get('measured_in') or "units"
+
+        if CASE_PRICE_PATTERN.search(text):
+            logger.info(f"Fast path: case price of {name}")
+            return (
+                f"A case of {name}{supplier} costs ${_format_amount(item.get('case_price', 0))} "
+                f"({_format_quantity(item.get('quantity_in_case', 0))} {measured_in} per case)."
+            )
+        if UNIT_COST_PATTERN.search(text):
+            logger.info(f"Fast path: unit cost of {name}")
+            measured = f" (measured in {item['measured_in']})" if item.get('measured_in') else ""
+            return f"{name}{supplier} costs ${_format_amount(item.get('cost_of_unit', 0))} per unit{measured}."
+        if TOTAL_UNITS_PATTERN.search(text):
+            logger.info(f"Fast path: total units of {name}")
+            return f"You have {_format_quantity(item.get('total_units', 0))} {measured_in} of {name}{supplier} in total."
+        return None
+
+    if INVENTORY_VALUE_PATTERN.search(text):
+        # Only single-dimension totals are precomputed
+        if _uncovered_words(text, category, supplier) or (category and supplier):
+            return None
+        if supplier:
+            logger.info(f"Fast path: inventory value from {supplier}")
+            group = aggregates["by_supplier"][supplier]
+            return (
+                f"Your inventory from {supplier} is worth ${_format_amount(group['inventory_value'])} "
+                f"across {group['items']} items."
+            )
+        if category:
+            logger.info(f"Fast path: inventory value of {category}")
+            group = aggregates["by_category"][category]
+            return (
+                f"Your {category} inventory is worth ${_format_amount(group['inventory_value'])} "
+                f"across {group['items']} items."
+            )
+        logger.info("Fast path: total inventory value")
+        return (
+            f"Your inventory is worth ${_format_amount(aggregates['inventory_value'])} "
+            f"across {aggregates['items']} items."
+        )
+
+    # Category totals cover the whole category, so any narrowing ("from Sysco", "excluding cheese") goes to the model
+    if not category or supplier or _uncovered_words(text, category):
+        return None
+    group = aggregates["by_category"][category]
+    if TOTAL_UNITS_PATTERN.search(text):
+        logger.info(f"Fast path: total units in {category}")
+        return f"You have {_format_quantity(group['total_units'])} total units across {group['items']} {category} items."
+    if ITEM_COUNT_PATTERN.search(text):
+        logger.info(f"Fast path: item count in {category}")
+        return f"You have {group['items']} {category} items in your inventory."
+    return None
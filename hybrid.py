@@ -0,0 +1,95 @@
+# hybrid.py
+import math
+import re
+import numpy as np
+from config import RRF_K
+
+# Fields matched by keyword (BM25) search alongside the vector query
+KEYWORD_SEARCH_FIELDS = ["inventory_item_name", "item_name", "item_number", "supplier_name"]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lower-case alphanumeric tokens, so item numbers and brand names match exactly."""
+    return TOKEN_PATTERN.findall(str(text or "").lower())
+
+class BM25:
+    """Okapi BM25 over a fixed list of tokenized documents, scored with NumPy postings."""
+
+    def __init__(self, documents, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        self.lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if self.size else 0.0
+
+        postings = {}
+        for row, tokens in enumerate(documents):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(row)
+                postings[token][1].append(count)
+        # term -> (rows, term frequencies)
+        self.postings = {
+            term: (np.array(rows, dtype=np.int64), np.array(counts, dtype=np.float32))
+            for term, (rows, counts) in postings.items()
+        }
+
+    def scores(self, query_tokens):
+        """BM25 score of every document for the query; zero where no term matches."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        if not self.size or not self.average_length:
+            return scores
+        for term in set(query_tokens):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, frequencies = posting
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * self.lengths[rows] / self.average_length)
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norms)
+        return scores
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked lists of keys (best first) into [(key, score)], best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda entry: entry[1], reverse=True)
+
+def rerank(question, results, top_k):
+    """Re-order retrieved items with cheap lexical features and keep the best top_k.
+
+    The retrieval rank is the prior; an item number or supplier named in the question,
+    and how much of the item's name the question covers, move items up.
+    """
+    question_tokens = set(tokenize(question))
+    scored = []
+    for position, result in enumerate(results):
+        score = 1.0 / (1 + position)
+
+        item_number_tokens = tokenize(result.get("item_number"))
+        if item_number_tokens and question_tokens.issuperset(item_number_tokens):
+            score += 2.0
+
+        supplier_tokens = tokenize(result.get("supplier_name"))
+        if supplier_tokens and question_tokens.issuperset(supplier_tokens):
+            score += 0.5
+
+        name_tokens = set(tokenize(result.get("inventory_item_name"))) | set(tokenize(result.get("item_name")))
+        if name_tokens:
+            score += len(name_tokens & question_tokens) / len(name_tokens)
+
+        scored.append((score, position, result))
+
+    scored.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [result for _, _, result in scored[:top_k]]
+
+def sort_results(results, order_by):
+    """Sort retrieved items by an OData order clause such as "case_price asc"."""
+    field, _, direction = order_by.partition(" ")
+    return sorted(results, key=lambda result: float(result.get(field) or 0), reverse=direction == "desc")
@@ -0,0 +1,91 @@
+# index_catalog.py
+import logging
+import threading
+import time
+from azure.core.exceptions import ResourceNotFoundError
+from clients import get_async_search_index_client
+from deadline import with_retries
+from config import INDEX_CATALOG_TTL_SECONDS
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("IndexCatalog")
+
+class IndexCatalog:
+    """TTL-cached view of which search indexes exist, updated locally on create and delete.
+
+    Cache misses query the service through the async index client, so they never block the event loop.
+    """
+
+    def __init__(self, ttl=INDEX_CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._names = None
+        self._listed_at = 0.0
+        # index name -> (exists, checked_at)
+        self._exists = {}
+
+    async def exists(self, index_name):
+        """Check a single index, using the cache or a direct lookup instead of a full listing."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._exists.get(index_name)
+            if cached and now - cached[1] < self.ttl:
+                return cached[0]
+            if self._names is not None and now - self._listed_at < self.ttl:
+                return index_name in self._names
+
+        try:
+            await with_retries(lambda: get_async_search_index_client().get_index(index_name), "index_lookup")
+            found = True
+        except ResourceNotFoundError:
+            found = False
+
+        with self._lock:
+            self._exists[index_name] = (found, time.monotonic())
+        return found
+
+    async def names(self, refresh=False):
+        """Return all index names, listing the service at most once per TTL unless ``refresh`` is set."""
+        now = time.monotonic()
+        with self._lock:
+            if not refresh and self._names is not None and now - self._listed_at < self.ttl:
+                return set(self._names)
+
+        logger.info("Refreshing index catalog listing")
+        async def list_names():
+            return {name async for name in get_async_search_index_client().list_index_names()}
+        names = await with_retries(list_names, "index_listing")
+
+        with self._lock:
+            self._names = names
+            self._listed_at = time.monotonic()
+            self._exists = {}
+        return set(names)
+
+    def add(self, index_name):
+        """Record an index this process just created."""
+        with self._lock:
+            self._exists[index_name] = (True, time.monotonic())
+            if self._names is not None:
+                self._names.add(index_name)
+
+    def discard(self, index_name):
+        """Record an index this process just deleted."""
+        with self._lock:
+            self._exists[index_name] = (False, time.monotonic())
+            if self._names is not None:
+                self._names.discard(index_name)
+
+# Shared catalog instance, created lazily and reused across all users
+_index_catalog = None
+
+def get_index_catalog():
+    """Return the shared index catalog."""
+    global _index_catalog
+    if _index_catalog is None:
+        _index_catalog = IndexCatalog()
+    return _index_catalog
@@ -0,0 +1,62 @@
+# index_snapshot.py
+import json
+import logging
+import os
+from config import INDEX_SNAPSHOT_DIR
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("IndexSnapshot")
+
+class IndexSnapshot:
+    """Record of which document ids (and content fingerprints) are in a user's index."""
+
+    def __init__(self, index_name, snapshot_dir=INDEX_SNAPSHOT_DIR):
+        self.index_name = index_name
+        self.path = os.path.join(snapshot_dir, f"{index_name}.json")
+        self.documents = {}
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def stamp(self):
+        """When the snapshot was last written (ns), or None; changes with every indexing run on any worker."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """Load the previous snapshot from disk; returns False if there is none."""
+        if not self.exists():
+            logger.info(f"No snapshot found for index: {self.index_name}")
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.documents = data.get("documents", {})
+            logger.info(f"Loaded snapshot for {self.index_name} with {len(self.documents)} documents")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading snapshot for {self.index_name}: {str(e)}")
+            self.documents = {}
+            return False
+
+    def save(self):
+        """Atomically write the snapshot to disk."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"index_name": self.index_name, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved snapshot for {self.index_name} with {len(self.documents)} documents")
+
+    def delete(self):
+        """Remove the snapshot file, e.g. once its index has been retired."""
+        if self.exists():
+            os.remove(self.path)
+            logger.info(f"Deleted snapshot for {self.index_name}")
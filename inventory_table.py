@@ -0,0 +1,257 @@
+# inventory_table.py
+import logging
+import re
+import numpy as np
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("InventoryTable")
+
+NUMERIC_COLUMNS = ("quantity_in_case", "total_units", "case_price", "cost_of_unit")
+TEXT_COLUMNS = ("inventory_item_name", "item_name", "item_number", "measured_in", "priced_by")
+CATEGORICAL_COLUMNS = ("category", "supplier_name")
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", str(text or "").lower())
+
+class InventoryTable:
+    """One tenant's items as NumPy columns, with categorical codes and precomputed aggregates.
+
+    Numeric fields are float64 arrays, category and supplier are int32 codes into value lists,
+    and rows stay contiguous (deletes move the last row into the freed slot). ``update`` applies
+    only the rows that changed; aggregates are recomputed lazily after any change.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, documents=()):
+        self.size = 0
+        self.ids = []
+        self.rows = {}
+        self.columns = {}
+        # field -> list of distinct values, and value -> code
+        self.categories = {field: [] for field in CATEGORICAL_COLUMNS}
+        self._codes = {field: {} for field in CATEGORICAL_COLUMNS}
+        self._allocate(self.INITIAL_CAPACITY)
+        self._fingerprints = []
+        self._aggregates = None
+        self._by_item_number = None
+        self._by_name_token = None
+        self._name_tokens = None
+        self.update(documents)
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, capacity):
+        columns = {field: np.zeros(capacity, dtype=np.float64) for field in NUMERIC_COLUMNS}
+        columns.update({field: np.full(capacity, "", dtype=object) for field in TEXT_COLUMNS})
+        columns.update({field: np.zeros(capacity, dtype=np.int32) for field in CATEGORICAL_COLUMNS})
+        for field, column in self.columns.items():
+            columns[field][:self.size] = column[:self.size]
+        self.columns = columns
+
+    def _code(self, field, value):
+        value = str(value or "")
+        code = self._codes[field].get(value)
+        if code is None:
+            code = len(self.categories[field])
+            self._codes[field][value] = code
+            self.categories[field].append(value)
+        return code
+
+    @staticmethod
+    def _fingerprint(document):
+        return tuple(document.get(field) for field in NUMERIC_COLUMNS + TEXT_COLUMNS + CATEGORICAL_COLUMNS)
+
+    def update(self, documents):
+        """Make the table match ``documents``, writing only new or changed rows.
+
+        Returns (upserted, deleted) row counts.
+        """
+        documents = {document['id']: document for document in documents}
+        removed = [doc_id for doc_id in self.ids if doc_id not in documents]
+        changed = [
+            document for doc_id, document in documents.items()
+            if doc_id not in self.rows or self._fingerprints[self.rows[doc_id]] != self._fingerprint(document)
+        ]
+
+        self._delete(removed)
+        needed = self.size + sum(1 for document in changed if document['id'] not in self.rows)
+        if needed > len(self.columns["case_price"]):
+            self._allocate(max(needed, 2 * len(self.columns["case_price"])))
+
+        for document in changed:
+            row = self.rows.get(document['id'])
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.rows[document['id']] = row
+                self.ids.append(document['id'])
+                self._fingerprints.append(None)
+            for field in NUMERIC_COLUMNS:
+                self.columns[field][row] = float(document.get(field) or 0)
+            for field in TEXT_COLUMNS:
+                self.columns[field][row] = str(document.get(field) or "")
+            for field in CATEGORICAL_COLUMNS:
+                self.columns[field][row] = self._code(field, document.get(field))
+            self._fingerprints[row] = self._fingerprint(document)
+
+        if changed or removed:
+            self._aggregates = None
+            self._by_item_number = None
+            self._by_name_token = None
+            logger.info(f"Inventory table updated: {len(changed)} upserted, {len(removed)} deleted, {self.size} rows")
+        return len(changed), len(removed)
+
+    def _delete(self, document_ids):
+        for doc_id in document_ids:
+            row = self.rows.pop(doc_id)
+            last = self.size - 1
+            if row != last:
+                moved_id = self.ids[last]
+                for column in self.columns.values():
+                    column[row] = column[last]
+                self.ids[row] = moved_id
+                self._fingerprints[row] = self._fingerprints[last]
+                self.rows[moved_id] = row
+            self.ids.pop()
+            self._fingerprints.pop()
+            self.size -= 1
+
+    def column(self, field):
+        return self.columns[field][:self.size]
+
+    def item(self, row):
+        """Return a row as a document-shaped dict."""
+        item = {'id': self.ids[row]}
+        item.update({field: float(self.columns[field][row]) for field in NUMERIC_COLUMNS})
+        item.update({field: self.columns[field][row] for field in TEXT_COLUMNS})
+        item.update({field: self.categories[field][self.columns[field][row]] for field in CATEGORICAL_COLUMNS})
+        return item
+
+    def values(self, field):
+        """Distinct non-empty values of a category or supplier present in the table."""
+        counts = np.bincount(self.column(field), minlength=len(self.categories[field]))
+        return sorted(value for value, count in zip(self.categories[field], counts) if count and value)
+
+    def rows_where(self, field, value):
+        """Rows whose category or supplier equals ``value``."""
+        code = self._codes[field].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.column(field) == code)
+
+    def _build_lookups(self):
+        self._by_item_number = {}
+        self._by_name_token = {}
+        self._name_tokens = []
+        for row in range(self.size):
+            item_number = self.columns["item_number"][row].strip().lower()
+            if item_number:
+                self._by_item_number.setdefault(item_number, []).append(row)
+            tokens = frozenset(
+                _tokens(self.columns["inventory_item_name"][row]) or _tokens(self.columns["item_name"][row])
+            )
+            self._name_tokens.append(tokens)
+            for token in tokens:
+                self._by_name_token.setdefault(token, set()).add(row)
+
+    def find_by_item_number(self, item_number):
+        if self._by_item_number is None:
+            self._build_lookups()
+        return [self.item(row) for row in self._by_item_number.get(str(item_number).lower(), [])]
+
+    def find_by_name(self, question_tokens):
+        """Items whose whole name appears in the question, keeping only the most specific names."""
+        if self._by_name_token is None:
+            self._build_lookups()
+        question_tokens = set(question_tokens)
+        candidates = set()
+        for token in question_tokens:
+            candidates |= self._by_name_token.get(token, set())
+
+        matches = [row for row in candidates if self._name_tokens[row] <= question_tokens]
+        if not matches:
+            return []
+        longest = max(len(self._name_tokens[row]) for row in matches)
+        return [self.item(row) for row in sorted(matches) if len(self._name_tokens[row]) == longest]
+
+    def extreme(self, field, largest=False, rows=None):
+        """The item with the smallest (or largest) value of a numeric field, optionally among ``rows``."""
+        rows = np.arange(self.size) if rows is None else rows
+        if not len(rows):
+            return None
+        values = self.column(field)[rows]
+        return self.item(int(rows[np.argmax(values) if largest else np.argmin(values)]))
+
+    @property
+    def aggregates(self):
+        """Per-category and per-supplier totals plus price extremes, recomputed after changes."""
+        if self._aggregates is None:
+            self._aggregates = self._compute_aggregates()
+        return self._aggregates
+
+    def _compute_aggregates(self):
+        value = self.column("total_units") * self.column("cost_of_unit")
+
+        def grouped(field):
+            codes = self.column(field)
+            width = len(self.categories[field])
+            totals = np.bincount(codes, weights=value, minlength=width)
+            units = np.bincount(codes, weights=self.column("total_units"), minlength=width)
+            counts = np.bincount(codes, minlength=width)
+            return {
+                self.categories[field][code]: {
+                    "items": int(counts[code]),
+                    "total_units": float(units[code]),
+                    "inventory_value": float(totals[code])
+                }
+                for code in range(width) if counts[code]
+            }
+
+        extremes = {}
+        if self.size:
+            for field in ("case_price", "cost_of_unit"):
+                column = self.column(field)
+                extremes[field] = {
+                    "min": self.item(int(np.argmin(column))),
+                    "max": self.item(int(np.argmax(column)))
+                }
+
+        return {
+            "items": self.size,
+            "total_units": float(self.column("total_units").sum()),
+            "inventory_value": float(value.sum()),
+            "by_category": grouped("category"),
+            "by_supplier": grouped("supplier_name"),
+            "price_extremes": extremes
+        }
+
+    def summary(self, max_groups=10):
+        """Compact text summary of the aggregates for prompt context."""
+        aggregates = self.aggregates
+        lines = [
+            f"Items: {aggregates['items']}, total units: {aggregates['total_units']:,.2f}, "
+            f"inventory value: ${aggregates['inventory_value']:,.2f}"
+        ]
+        for title, key in (("Inventory value by category", "by_category"), ("Inventory value by supplier", "by_supplier")):
+            groups = sorted(aggregates[key].items(), key=lambda entry: entry[1]["inventory_value"], reverse=True)
+            if groups:
+                lines.append(f"{title}:")
+                lines.extend(
+                    f"  {name or 'Unknown'}: ${group['inventory_value']:,.2f} ({group['items']} items, "
+                    f"{group['total_units']:,.2f} units)"
+                    for name, group in groups[:max_groups]
+                )
+        for field, label in (("case_price", "case price"), ("cost_of_unit", "unit cost")):
+            extremes = aggregates["price_extremes"].get(field)
+            if extremes:
+                lines.append(
+                    f"Lowest {label}: {extremes['min']['inventory_item_name']} (${extremes['min'][field]:,.2f}); "
+                    f"highest {label}: {extremes['max']['inventory_item_name']} (${extremes['max'][field]:,.2f})"
+                )
+        return "\n".join(lines)
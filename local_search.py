@@ -0,0 +1,262 @@
+# local_search.py
+import asyncio
+import logging
+import time
+from config import EMBEDDING_DIMENSIONS
+from search import (
+    SEARCH_SELECT_FIELDS,
+    versioned_index_name,
+    load_live_version,
+    save_live_version,
+    retire_after_grace,
+    sweep_retired_indexes
+)
+from vector_index import LocalVectorIndex
+from vector_snapshot import delete_snapshot, snapshot_version
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("LocalVectorStore")
+
+# Process-wide local indexes, so evicting an assistant does not drop its data
+_local_indexes = {}
+# user_id -> live version
+_live_versions = {}
+
+def find_live_local_index(user_id):
+    """Resolve a user's live local (index_name, version), or None if there is none.
+
+    The persisted live version comes first, since another worker may have swapped it;
+    this process's own record covers an index not yet written to disk.
+    """
+    version = load_live_version(user_id)
+    if version is not None:
+        index_name = versioned_index_name(user_id, version)
+        if index_name in _local_indexes or snapshot_version(index_name) is not None:
+            return index_name, version
+
+    version = _live_versions.get(user_id)
+    if version is not None:
+        return versioned_index_name(user_id, version), version
+    return None
+
+async def delete_local_index(index_name):
+    """Drop a retired local index and its snapshot."""
+    _local_indexes.pop(index_name, None)
+    delete_snapshot(index_name)
+
+async def sweep_retired_local_indexes():
+    await sweep_retired_indexes(delete_local_index)
+
+def _get_local_index(index_name):
+    """Return a process-wide local index, opening it from its snapshot if needed."""
+    index = _local_indexes.get(index_name)
+    if index is None or index.is_stale():
+        index = LocalVectorIndex.open(index_name)
+        if index is not None:
+            _local_indexes[index_name] = index
+    return index
+
+class LocalVectorStore:
+    """In-process vector store with the same interface as the Azure-backed VectorStore."""
+
+    def __init__(self, user_id):
+        logger.info(f"Initializing LocalVectorStore for user {user_id}")
+        self.user_id = user_id
+        self.base_index_name = f"inventory-{user_id}"
+        self.version = 0
+        self.index_name = self.base_index_name
+        self.search_client = None
+        self.rebuild = None
+        self.shadow_client = None
+
+        self._resolve_live_index()
+
+    def _resolve_live_index(self):
+        live_index = find_live_local_index(self.user_id)
+        if live_index:
+            self.index_name, self.version = live_index
+            self.search_client = _get_local_index(self.index_name)
+            _live_versions[self.user_id] = self.version
+            logger.info(f"Found existing local index: {self.index_name}")
+        else:
+            logger.info(f"No existing local index found for: {self.base_index_name}")
+
+    @property
+    def dimensions(self):
+        """Vector dimensions of the live index; the configured ones until it holds vectors."""
+        if self.search_client is None or self.search_client.dimensions is None:
+            return EMBEDDING_DIMENSIONS
+        return self.search_client.dimensions
+
+    def needs_migration(self):
+        """True if the live index holds vectors of different dimensions than configured."""
+        return self.search_client is not None and self.search_client.dimensions not in (None, EMBEDDING_DIMENSIONS)
+
+    async def connect_to_live_index(self):
+        """Resolve the live local index again, following swaps by other workers; False if there is none."""
+        self._resolve_live_index()
+        return self.search_client is not None
+
+    async def connect_to_index(self):
+        if not self.search_client:
+            self.search_client = _get_local_index(self.index_name)
+        return self.search_client is not None
+
+    async def create_index(self):
+        """Replace the live index with an empty one."""
+        self.search_client = LocalVectorIndex(self.index_name)
+        _local_indexes[self.index_name] = self.search_client
+        _live_versions[self.user_id] = self.version
+        save_live_version(self.user_id, self.index_name, self.version)
+        logger.info(f"Created local index: {self.index_name}")
+        return True
+
+    async def begin_rebuild(self):
+        """Create an empty shadow index for the next version and return its name."""
+        # Past every version recorded live or still on disk, so no other worker's index is reused
+        version = max(self.version, load_live_version(self.user_id) or 0) + 1
+        index_name = versioned_index_name(self.user_id, version)
+        while index_name in _local_indexes or snapshot_version(index_name) is not None:
+            version += 1
+            index_name = versioned_index_name(self.user_id, version)
+        logger.info(f"Starting rebuild of {self.base_index_name} into local shadow index {index_name}")
+        self.shadow_client = LocalVectorIndex(index_name)
+        self.rebuild = {
+            "state": "building",
+            "index_name": index_name,
+            "version": version,
+            "total": 0,
+            "indexed": 0,
+            "started_at": time.time(),
+            "completed_at": None
+        }
+        return index_name
+
+    def set_rebuild_total(self, total):
+        if self.rebuild:
+            self.rebuild["total"] = total
+
+    async def complete_rebuild(self):
+        """Swap the live index to the shadow index and retire the old one."""
+        if not self.rebuild or self.rebuild["state"] != "building":
+            raise ValueError("No rebuild in progress")
+
+        # The version this worker served, and the one recorded live if another worker swapped since
+        live_version = load_live_version(self.user_id)
+        retired_index_names = {
+            self.index_name if self.search_client else None,
+            versioned_index_name(self.user_id, live_version) if live_version is not None else None
+        }
+        self.search_client = self.shadow_client
+        self.shadow_client = None
+        self.index_name = self.rebuild["index_name"]
+        self.version = self.rebuild["version"]
+        _local_indexes[self.index_name] = self.search_client
+        _live_versions[self.user_id] = self.version
+        save_live_version(self.user_id, self.index_name, self.version)
+        # Other workers may still be reading the old snapshot until they follow the new live version
+        for index_name in retired_index_names - {None, self.index_name}:
+            retire_after_grace(self.user_id, index_name, delete_local_index)
+
+        self.rebuild["state"] = "completed"
+        self.rebuild["completed_at"] = time.time()
+        logger.info(f"Swapped live local index for {self.base_index_name} to {self.index_name}")
+
+    async def abort_rebuild(self):
+        if not self.rebuild or self.rebuild["state"] != "building":
+            return
+        logger.warning(f"Aborting local rebuild into {self.rebuild['index_name']}")
+        self.rebuild["state"] = "failed"
+        self.rebuild["completed_at"] = time.time()
+        self.shadow_client = None
+
+    def rebuild_status(self):
+        return {
+            "live_index": self.index_name if self.search_client else None,
+            "live_version": self.version if self.search_client else None,
+            "live_dimensions": self.search_client.dimensions if self.search_client else None,
+            "rebuild": dict(self.rebuild) if self.rebuild else None
+        }
+
+    async def add_documents(self, documents, index_name=None):
+        """Upsert documents into the live index, or the shadow index of a running rebuild.
+
+        Returns the ids of the documents that were indexed.
+        """
+        rebuilding = bool(index_name and self.rebuild and self.rebuild["state"] == "building"
+                          and index_name == self.rebuild["index_name"])
+        if index_name and index_name != self.index_name and not rebuilding:
+            raise ValueError(f"Unknown target index: {index_name}")
+
+        target = self.shadow_client if rebuilding else self.search_client
+        if target is None:
+            raise ValueError("Local index not initialized")
+
+        validated_docs = []
+        for i, doc in enumerate(documents or []):
+            if not doc.get('id'):
+                logger.warning(f"Document {i} missing id field, skipping")
+                continue
+            vector = doc.get('content_vector')
+            if vector is None or len(vector) == 0:
+                logger.warning(f"Document {i} missing content_vector, skipping")
+                continue
+            if len(vector) != EMBEDDING_DIMENSIONS:
+                logger.warning(f"Document {i} has incorrect vector dimensions: {len(vector)}, skipping")
+                continue
+            validated_docs.append(doc)
+
+        target.upsert(validated_docs)
+        if rebuilding:
+            self.rebuild["indexed"] += len(validated_docs)
+        logger.info(f"Upserted {len(validated_docs)} documents into local index {target.name}")
+        return [doc['id'] for doc in validated_docs]
+
+    async def persist_snapshot(self, index_name=None):
+        """Write the live index (or the named shadow index) to its on-disk snapshot."""
+        target = self.shadow_client if index_name and index_name != self.index_name else self.search_client
+        if target is not None:
+            await asyncio.to_thread(target.save)
+
+    async def delete_documents(self, document_ids):
+        if self.search_client is None:
+            raise ValueError("Local index not initialized")
+        self.search_client.delete(document_ids)
+        logger.info(f"Deleted {len(document_ids)} documents from local index {self.index_name}")
+
+    async def field_values(self, field):
+        """Distinct values of a string field, used to recognise filter values in questions."""
+        if self.search_client is None:
+            return []
+        return self.search_client.field_values(field)
+
+    async def search(self, query_vector, top_k=5, filter_condition=None, query_text=None, order_by=None):
+        """Exact (or HNSW for large tenants) cosine top-k over the tenant's vectors.
+
+        With ``query_text``, BM25 keyword matches are fused in by reciprocal rank fusion.
+        With ``order_by``, the filtered items are sorted by that field instead of by similarity.
+        """
+        if self.search_client is None:
+            raise ValueError("Local index not initialized")
+        if self.search_client.is_stale():
+            self.search_client = _get_local_index(self.index_name)
+
+        if order_by:
+            matches = self.search_client.ordered_search(order_by, top_k, filter_condition)
+        elif query_vector is None:
+            matches = self.search_client.keyword_search(query_text or "", top_k, filter_condition)
+        elif query_text:
+            matches = self.search_client.hybrid_search(query_vector, query_text, top_k, filter_condition)
+        else:
+            matches = self.search_client.search(query_vector, top_k, filter_condition)
+        results = []
+        for row, score in matches:
+            result = self.search_client.document(row, SEARCH_SELECT_FIELDS)
+            result["@search.score"] = score
+            results.append(result)
+        logger.info(f"Local search returned {len(results)} results")
+        return results
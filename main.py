@@ -5,15 +5,23 @@ import uuid
 import asyncio
 from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any
 import time
+import json
+from contextlib import aclosing
 from rag import RAGAssistant
+from vector_backends import user_index_exists, sweep_retired_indexes
+from clients import close_clients
+from rate_limiter import get_rate_limiter
+from deadline import deadline_after, retry_stats, DeadlineExceeded
+from registry import AssistantRegistry
+from singleflight import SingleFlight
+from config import ASSISTANT_SWEEP_INTERVAL_SECONDS, QUERY_DEADLINE_SECONDS
+from embedding_cache import get_embedding_cache
+from token_budget import preload_encodings
 import uvicorn
-from azure.search.documents.indexes import SearchIndexClient
-from azure.core.credentials import AzureKeyCredential
-from config import SEARCH_SERVICE_ENDPOINT, SEARCH_SERVICE_KEY
 
 # Configure logging
 logging.basicConfig(
@@ -37,8 +45,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store RAG assistants in memory
-rag_assistants: Dict[str, RAGAssistant] = {}
+# Store RAG assistants in a bounded in-memory registry
+rag_assistants = AssistantRegistry()
 
 # Request and response models
 class Question(BaseModel):
@@ -50,6 +58,10 @@ class Response(BaseModel):
     response: str
     conversation_id: str
     processing_time: float
+    cached: bool = False
+    fast_path: bool = False
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
 
 class InitializeRequest(BaseModel):
     user_id: str
@@ -69,16 +81,49 @@ async def add_process_time_header(request: Request, call_next):
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
+# Periodically evict assistants for idle tenants
+async def sweep_idle_assistants():
+    while True:
+        await asyncio.sleep(ASSISTANT_SWEEP_INTERVAL_SECONDS)
+        try:
+            evicted = rag_assistants.evict_idle()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle assistants, {len(rag_assistants)} resident")
+        except Exception as e:
+            logger.error(f"Error sweeping idle assistants: {str(e)}")
+
+@app.on_event("startup")
+async def start_assistant_sweeper():
+    app.state.assistant_sweeper = asyncio.create_task(sweep_idle_assistants())
+
+# Tokenizer vocabularies are downloaded on first use; fetch them before serving instead of on a query
+@app.on_event("startup")
+async def load_token_encodings():
+    await asyncio.to_thread(preload_encodings)
+
+# Retired index versions outlive the process that retired them; delete them in the background
+@app.on_event("startup")
+async def start_retired_index_sweep():
+    app.state.retired_index_sweep = asyncio.create_task(sweep_retired_indexes())
+
+# Release shared upstream connection pools on shutdown
+@app.on_event("shutdown")
+async def shutdown_clients():
+    sweeper = getattr(app.state, "assistant_sweeper", None)
+    if sweeper:
+        sweeper.cancel()
+    retired_index_sweep = getattr(app.state, "retired_index_sweep", None)
+    if retired_index_sweep:
+        retired_index_sweep.cancel()
+    for migration in list(index_migrations):
+        migration.cancel()
+    await close_clients()
+
 # Helper function to check if index exists
 async def index_exists(user_id: str):
     try:
-        index_name = f"inventory-{user_id}"
-        index_client = SearchIndexClient(
-            endpoint=SEARCH_SERVICE_ENDPOINT,
-            credential=AzureKeyCredential(SEARCH_SERVICE_KEY)
-        )
-        indexes = list(index_client.list_index_names())
-        return index_name in indexes
+        rag_assistant = rag_assistants.get(user_id)
+        return await user_index_exists(user_id, rag_assistant.vector_store if rag_assistant else None)
     except Exception as e:
         logger.error(f"Error checking index existence: {str(e)}")
         return False
@@ -88,6 +133,66 @@ async def index_exists(user_id: str):
 async def health_check():
     return {"status": "healthy", "timestamp": time.time()}
 
+# Service metrics
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "assistants": rag_assistants.stats(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "rate_limits": get_rate_limiter().stats(),
+        "upstream": retry_stats(),
+        "timestamp": time.time()
+    }
+
+# Coordinates assistant creation and index builds so each runs once per user at a time
+index_builds = SingleFlight()
+
+# Background migrations of outdated indexes, referenced until they finish
+index_migrations = set()
+
+async def migrate_user_index(user_id: str, rag_assistant: RAGAssistant):
+    """Rebuild an outdated index blue/green while queries keep using the live one."""
+    try:
+        await index_builds.do(("index", user_id), rag_assistant.initialize)
+        logger.info(f"Migrated index for user {user_id}")
+    except Exception as e:
+        logger.error(f"Error migrating index for user {user_id}: {str(e)}")
+
+async def create_assistant(user_id: str):
+    logger.info(f"Creating new RAG assistant for user {user_id}")
+    rag_assistant = RAGAssistant(user_id)
+    await rag_assistant.connect()
+    if not rag_assistant.vector_store.search_client:
+        await rag_assistant.initialize()
+    else:
+        try:
+            await rag_assistant.load_inventory_table()
+        except Exception as e:
+            # Only the LLM-free fast path depends on the table
+            logger.warning(f"Could not load inventory table for user {user_id}: {str(e)}")
+        # Indexes with other embedding dimensions or an older schema are migrated by a blue/green
+        # rebuild; it re-embeds every item, so it runs in the background instead of holding up a query
+        if rag_assistant.vector_store.needs_migration():
+            logger.info(f"Scheduling index migration for user {user_id}")
+            migration = asyncio.create_task(migrate_user_index(user_id, rag_assistant))
+            index_migrations.add(migration)
+            migration.add_done_callback(index_migrations.discard)
+    rag_assistants[user_id] = rag_assistant
+    return rag_assistant
+
+async def get_or_create_assistant(user_id: str):
+    """Return the user's assistant, creating it (and building a missing index) exactly once."""
+    if user_id in rag_assistants:
+        return rag_assistants[user_id]
+    return await index_builds.do(("assistant", user_id), lambda: create_assistant(user_id))
+
+async def rebuild_user_index(user_id: str, full_rebuild: bool = False):
+    """Refresh or fully rebuild a user's index, coalescing concurrent requests into one build."""
+    rag_assistant = await get_or_create_assistant(user_id)
+    build = rag_assistant.initialize if full_rebuild else rag_assistant.index_user_documents
+    await index_builds.do(("index", user_id), build)
+    return rag_assistant
+
 # Initialize user RAG system
 @app.post("/initialize/{user_id}", response_model=InitializeResponse)
 async def initialize_user_rag(user_id: str, request: InitializeRequest = None):
@@ -100,19 +205,19 @@ async def initialize_user_rag(user_id: str, request: InitializeRequest = None):
             return InitializeResponse(
                 message=f"RAG system already initialized for user {user_id}",
                 status="existing",
-                index_name=f"inventory-{user_id}"
+                index_name=rag_assistants[user_id].vector_store.index_name
             )
         
-        # Create new RAG assistant
-        logger.info(f"Creating new RAG assistant for user {user_id}")
-        rag_assistant = RAGAssistant(user_id)
-        await rag_assistant.initialize()
-        rag_assistants[user_id] = rag_assistant
+        if force_rebuild and index_exists_flag:
+            logger.info(f"Rebuilding index for user {user_id}")
+            rag_assistant = await rebuild_user_index(user_id, full_rebuild=True)
+        else:
+            rag_assistant = await get_or_create_assistant(user_id)
         
         return InitializeResponse(
             message=f"RAG system initialized for user {user_id}",
             status="created",
-            index_name=f"inventory-{user_id}"
+            index_name=rag_assistant.vector_store.index_name
         )
     except Exception as e:
         logger.error(f"Error initializing RAG system: {str(e)}")
@@ -123,12 +228,7 @@ async def lazy_initialize(user_id: str):
     try:
         if user_id not in rag_assistants:
             logger.info(f"Lazy initializing RAG system for user {user_id}")
-            rag_assistant = RAGAssistant(user_id)
-            if await index_exists(user_id):
-                await rag_assistant.vector_store.connect_to_index()
-            else:
-                await rag_assistant.initialize()
-            rag_assistants[user_id] = rag_assistant
+            await get_or_create_assistant(user_id)
             logger.info(f"Lazy initialization complete for user {user_id}")
     except Exception as e:
         logger.error(f"Error in lazy initialization: {str(e)}")
@@ -143,17 +243,14 @@ async def query_rag(question: Question, background_tasks: BackgroundTasks):
     try:
         # Check if RAG assistant exists or needs initialization
         if user_id not in rag_assistants:
-            # Add initialization as background task and use simpler response for now
-            background_tasks.add_task(lazy_initialize, user_id)
-            
             # Check if index exists
             if await index_exists(user_id):
                 logger.info(f"Index exists for user {user_id}, connecting...")
-                rag_assistant = RAGAssistant(user_id)
-                await rag_assistant.vector_store.connect_to_index()
-                rag_assistants[user_id] = rag_assistant
+                await get_or_create_assistant(user_id)
             else:
                 logger.info(f"No index found for user {user_id}")
+                # Build in the background; concurrent cold queries share one build
+                background_tasks.add_task(lazy_initialize, user_id)
                 # Return a helpful message while initialization happens in background
                 return Response(
                     response="I'm preparing your inventory data for the first time. Please ask your question again in a few moments.",
@@ -161,17 +258,33 @@ async def query_rag(question: Question, background_tasks: BackgroundTasks):
                     processing_time=time.time() - start_time
                 )
         
-        # Get response from RAG assistant
+        # Get response from RAG assistant; embedding, search and completion share one deadline
         rag_assistant = rag_assistants[user_id]
-        response = await rag_assistant.query(question.text)
+        with deadline_after(QUERY_DEADLINE_SECONDS):
+            result = await rag_assistant.query(question.text)
         
         processing_time = time.time() - start_time
-        logger.info(f"Processed query in {processing_time:.2f} seconds")
+        usage = result.get("usage", {})
+        logger.info(
+            f"Processed query in {processing_time:.2f} seconds "
+            f"(cached: {result['cached']}, fast path: {result.get('fast_path', False)}, "
+            f"tokens: {usage.get('prompt_tokens', 0)} prompt / {usage.get('completion_tokens', 0)} completion)"
+        )
         
         return Response(
-            response=response,
+            response=result["response"],
             conversation_id=conversation_id,
-            processing_time=processing_time
+            processing_time=processing_time,
+            cached=result["cached"],
+            fast_path=result.get("fast_path", False),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0)
+        )
+    except DeadlineExceeded as e:
+        logger.error(f"Query for user {user_id} timed out after {time.time() - start_time:.2f} seconds: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"The query could not be answered within {QUERY_DEADLINE_SECONDS:g} seconds. Please try again."
         )
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -183,18 +296,79 @@ async def query_rag(question: Question, background_tasks: BackgroundTasks):
             processing_time=time.time() - start_time
         )
 
+def sse_event(event: str, data: Dict[str, Any]):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming query endpoint (Server-Sent Events)
+@app.post("/query/stream")
+async def query_rag_stream(question: Question, request: Request, background_tasks: BackgroundTasks):
+    start_time = time.time()
+    user_id = question.user_id
+    conversation_id = question.conversation_id or str(uuid.uuid4())
+    
+    async def event_stream():
+        first_token_time = None
+        try:
+            # Check if RAG assistant exists or needs initialization
+            if user_id not in rag_assistants and not await index_exists(user_id):
+                logger.info(f"No index found for user {user_id}")
+                yield sse_event("token", {"text": "I'm preparing your inventory data for the first time. Please ask your question again in a few moments."})
+            else:
+                rag_assistant = await get_or_create_assistant(user_id)
+                # The deadline bounds the time to the first token; a running answer is not cut off
+                with deadline_after(QUERY_DEADLINE_SECONDS):
+                    async with aclosing(rag_assistant.query_stream(question.text)) as events:
+                        async for event in events:
+                            if await request.is_disconnected():
+                                # Leaving the block closes the generator, which cancels the upstream completion
+                                logger.info(f"Client disconnected, cancelling streaming query for user {user_id}")
+                                return
+                            if event["event"] == "token" and first_token_time is None:
+                                first_token_time = time.time()
+                            yield sse_event(event["event"], event["data"])
+        except DeadlineExceeded as e:
+            logger.error(f"Streaming query for user {user_id} timed out: {str(e)}")
+            yield sse_event("error", {
+                "message": f"The query could not be answered within {QUERY_DEADLINE_SECONDS:g} seconds. Please try again.",
+                "timeout": True
+            })
+        except Exception as e:
+            logger.error(f"Error processing streaming query: {str(e)}")
+            yield sse_event("error", {"message": "I encountered an issue while processing your request. Please try again."})
+        
+        processing_time = time.time() - start_time
+        time_to_first_token = first_token_time - start_time if first_token_time else None
+        logger.info(f"Streamed query in {processing_time:.2f} seconds (time to first token: {time_to_first_token})")
+        yield sse_event("done", {
+            "conversation_id": conversation_id,
+            "processing_time": processing_time,
+            "time_to_first_token": time_to_first_token
+        })
+    
+    if user_id not in rag_assistants:
+        # Build in the background if needed; concurrent cold queries share one build
+        background_tasks.add_task(lazy_initialize, user_id)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
 # Refresh user index
 @app.post("/refresh/{user_id}")
 async def refresh_user_index(user_id: str):
     try:
-        if user_id in rag_assistants:
+        if user_id in rag_assistants or await index_exists(user_id):
             logger.info(f"Refreshing index for user {user_id}")
-            await rag_assistants[user_id].index_user_documents()
+            await rebuild_user_index(user_id)
             return {"message": f"Index refreshed for user {user_id}", "status": "success"}
         else:
             # Initialize if not exists
             logger.info(f"User {user_id} not initialized, creating new assistant")
-            await initialize_user_rag(user_id)
+            await get_or_create_assistant(user_id)
             return {"message": f"Created new index for user {user_id}", "status": "created"}
     except Exception as e:
         logger.error(f"Error refreshing index: {str(e)}")
@@ -206,12 +380,20 @@ async def get_index_status(user_id: str):
     try:
         index_exists_flag = await index_exists(user_id)
         assistant_loaded = user_id in rag_assistants
+        index_status = (
+            rag_assistants[user_id].vector_store.rebuild_status()
+            if assistant_loaded
+            else {"live_index": None, "live_version": None, "live_dimensions": None, "rebuild": None}
+        )
+        answer_cache_stats = rag_assistants[user_id].answer_cache.stats() if assistant_loaded else None
         
         return {
             "user_id": user_id,
             "index_exists": index_exists_flag,
             "assistant_loaded": assistant_loaded,
-            "status": "ready" if index_exists_flag and assistant_loaded else "not_ready"
+            "status": "ready" if index_exists_flag and assistant_loaded else "not_ready",
+            "answer_cache": answer_cache_stats,
+            **index_status
         }
     except Exception as e:
         logger.error(f"Error checking status: {str(e)}")
@@ -0,0 +1,152 @@
+# odata_filter.py
+import re
+import numpy as np
+
+# Subset of the OData filter syntax used by Azure Cognitive Search:
+#   field eq|ne|gt|ge|lt|le literal, and, or, not, parentheses,
+#   search.in(field, 'a,b,c'[, 'delimiters'])
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<string>'(?:[^']|'')*')|(?P<number>-?\d+(?:\.\d+)?)|(?P<name>[A-Za-z_][\w.]*)|(?P<punct>[(),]))"
+)
+
+COMPARISON_OPERATORS = {
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "gt": np.greater,
+    "ge": np.greater_equal,
+    "lt": np.less,
+    "le": np.less_equal,
+}
+
+class ODataFilterError(ValueError):
+    pass
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise ODataFilterError(f"Unexpected input at position {position}: {text[position:position + 20]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1].replace("''", "'")
+        elif kind == "number":
+            value = float(value)
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value is not None and token[1] != value):
+            raise ODataFilterError(f"Expected {value or kind}, got {token[1]!r}")
+        self.position += 1
+        return token
+
+    def keyword(self, word):
+        kind, value = self.peek()
+        return kind == "name" and value.lower() == word
+
+    def parse(self):
+        node = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ODataFilterError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.keyword("or"):
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.keyword("and"):
+            self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.keyword("not"):
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.peek()
+        if kind == "punct" and value == "(":
+            self.take()
+            node = self.parse_or()
+            self.take("punct", ")")
+            return node
+
+        if kind == "name" and value.lower() == "search.in":
+            self.take()
+            self.take("punct", "(")
+            field = self.take("name")[1]
+            self.take("punct", ",")
+            values = self.take("string")[1]
+            delimiters = ", "
+            if self.peek() == ("punct", ","):
+                self.take()
+                delimiters = self.take("string")[1]
+            self.take("punct", ")")
+            split_pattern = "[" + re.escape(delimiters) + "]"
+            return ("in", field, [v for v in re.split(split_pattern, values) if v])
+
+        if kind == "name" and value.lower() in ("true", "false"):
+            self.take()
+            return ("const", value.lower() == "true")
+
+        field = self.take("name")[1]
+        operator = self.take("name")[1].lower()
+        if operator not in COMPARISON_OPERATORS:
+            raise ODataFilterError(f"Unsupported operator: {operator}")
+        literal_kind, literal = self.peek()
+        if literal_kind not in ("string", "number"):
+            raise ODataFilterError(f"Expected a literal after {field} {operator}")
+        self.take()
+        return ("compare", field, operator, literal)
+
+def parse_filter(text):
+    """Parse an OData filter expression into a small expression tree."""
+    return _Parser(_tokenize(text)).parse()
+
+def evaluate_filter(node, columns, size):
+    """Evaluate a parsed filter against columnar field arrays, returning a boolean mask."""
+    kind = node[0]
+    if kind == "and":
+        return evaluate_filter(node[1], columns, size) & evaluate_filter(node[2], columns, size)
+    if kind == "or":
+        return evaluate_filter(node[1], columns, size) | evaluate_filter(node[2], columns, size)
+    if kind == "not":
+        return ~evaluate_filter(node[1], columns, size)
+    if kind == "const":
+        return np.full(size, node[1], dtype=bool)
+
+    field = node[1]
+    if field not in columns:
+        raise ODataFilterError(f"Unknown filter field: {field}")
+    column = columns[field][:size]
+
+    if kind == "in":
+        return np.isin(column, np.asarray(node[2], dtype=object))
+
+    _, _, operator, literal = node
+    if column.dtype == object and not isinstance(literal, str):
+        raise ODataFilterError(f"Field {field} is a string field, got {literal!r}")
+    if column.dtype != object and isinstance(literal, str):
+        raise ODataFilterError(f"Field {field} is a numeric field, got {literal!r}")
+    return np.asarray(COMPARISON_OPERATORS[operator](column, literal), dtype=bool)
@@ -0,0 +1,56 @@
+# quantization.py
+import numpy as np
+
+# Compact codes for embedding vectors, scanned first and then re-ranked at full precision:
+#   "int8"   - symmetric scalar quantization with one scale per vector (4x smaller than float32)
+#   "binary" - one sign bit per dimension, compared by Hamming distance (32x smaller)
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Rows scanned per step; small enough that an int8 chunk's float32 copy stays in cache
+SCAN_CHUNK_ROWS = 256
+
+# Set bits per byte value, for Hamming distance on NumPy releases without bitwise_count
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+def _popcount(codes):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes)
+    return _POPCOUNT[codes]
+
+def validate_mode(mode):
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown vector quantization {mode!r}, expected one of {', '.join(QUANTIZATION_MODES)}")
+    return mode
+
+def code_shape(mode, dimensions):
+    """Per-vector code shape and dtype for a quantization mode."""
+    if mode == "int8":
+        return (dimensions,), np.int8
+    if mode == "binary":
+        return ((dimensions + 7) // 8,), np.uint8
+    raise ValueError(f"Mode {mode!r} has no codes")
+
+def quantize_int8(vectors):
+    """Quantize rows to int8 codes and per-row float32 scales, so that vector ~= codes * scale."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def binary_codes(vectors):
+    """Pack the sign of every dimension into bits."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+def int8_scores(codes, scales, query):
+    """Approximate dot products of a float32 query against int8-coded rows."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_CHUNK_ROWS):
+        chunk = codes[start:start + SCAN_CHUNK_ROWS]
+        scores[start:start + len(chunk)] = (chunk.astype(np.float32) @ query) * scales[start:start + len(chunk)]
+    return scores
+
+def hamming_distances(codes, query_code):
+    """Number of differing sign bits between each packed row and the packed query."""
+    return _popcount(np.bitwise_xor(codes, query_code)).sum(axis=1, dtype=np.uint16)
@@ -0,0 +1,116 @@
+# query_parser.py
+import re
+
+# Ranking intents: phrase pattern -> (field, direction); "{price}" is case_price or cost_of_unit
+SORT_INTENTS = [
+    (re.compile(r"\b(cheapest|least expensive|lowest[- ]priced|lowest (?:price|cost))\b"), ("{price}", "asc")),
+    (re.compile(r"\b(most expensive|priciest|highest[- ]priced|highest (?:price|cost))\b"), ("{price}", "desc")),
+    (re.compile(r"\b(lowest stock|least stock|running low|low on|fewest units|least units|lowest quantity)\b"), ("total_units", "asc")),
+    (re.compile(r"\b(most stock|highest stock|most units|highest quantity|largest quantity)\b"), ("total_units", "desc")),
+]
+
+# An amount is only a price with a currency attached: "$12", "12 dollars", "12 bucks"
+AMOUNT = r"(\$)?\s*(\d+(?:\.\d+)?)(\s*(?:dollars?|bucks)\b)?"
+PRICE_RANGES = [
+    (re.compile(rf"\bbetween\s+{AMOUNT}\s+(?:and|to)\s+{AMOUNT}"), ("ge", "le")),
+    # Inclusive bounds first, so "no more than" is not read as "more than"
+    (re.compile(rf"\b(?:at most|no more than|up to)\s+{AMOUNT}"), ("le",)),
+    (re.compile(rf"\b(?:at least|no less than)\s+{AMOUNT}"), ("ge",)),
+    (re.compile(rf"\b(?:under|below|less than|cheaper than)\s+{AMOUNT}"), ("lt",)),
+    (re.compile(rf"\b(?:over|above|more than|greater than|pricier than)\s+{AMOUNT}"), ("gt",)),
+]
+
+# Mentions of a per-unit price; otherwise prices refer to the case
+UNIT_PRICE_PATTERN = re.compile(r"\b(per unit|unit (?:cost|price)|each|per item|per piece)\b")
+
+# Category names that are also everyday words only become filters next to a field cue
+GENERIC_CATEGORY_WORDS = frozenset("""
+    other others general misc miscellaneous various assorted part parts supply supplies item items
+    product products goods stuff food foods all any main new special specials extra extras default
+    unknown none fresh dry bar kitchen house regular standard basic
+""".split())
+CATEGORY_CUE_WORDS = r"categor(?:y|ies)|section|department|aisle"
+
+def _odata_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _mentions(question, value):
+    """True if a vocabulary value (or its singular/plural form) appears as a phrase in the question."""
+    phrase = " ".join(re.findall(r"[a-z0-9&]+", str(value).lower()))
+    if not phrase:
+        return False
+    forms = {phrase, phrase.rstrip("s"), phrase + "s"}
+    return any(re.search(rf"\b{re.escape(form)}\b", question) for form in forms if form)
+
+def match_vocabulary(question, values):
+    """Values mentioned in the question, preferring the longest phrases."""
+    matches = [value for value in values if _mentions(question, value)]
+    matches.sort(key=lambda value: len(str(value)), reverse=True)
+    return matches
+
+def _category_mentioned(question, value):
+    """True if the question names a category unambiguously.
+
+    Multi-word names must appear exactly. A single word that is also everyday English
+    ("other", "general", "parts") needs a field cue next to it: "in category other", "the parts section".
+    """
+    words = re.findall(r"[a-z0-9&]+", str(value).lower())
+    if not words:
+        return False
+    phrase = " ".join(words)
+    if len(words) > 1:
+        return re.search(rf"\b{re.escape(phrase)}\b", question) is not None
+    if phrase not in GENERIC_CATEGORY_WORDS:
+        return _mentions(question, value)
+    forms = "|".join(re.escape(form) for form in {phrase, phrase.rstrip("s"), phrase + "s"} if form)
+    return re.search(
+        rf"\b(?:{CATEGORY_CUE_WORDS})\s+(?:(?:of|called|named)\s+)?(?:{forms})\b"
+        rf"|\b(?:{forms})\s+(?:{CATEGORY_CUE_WORDS})\b",
+        question
+    ) is not None
+
+def match_categories(question, values):
+    """Categories the question refers to, preferring the longest names."""
+    matches = [value for value in values if _category_mentioned(question, value)]
+    matches.sort(key=lambda value: len(str(value)), reverse=True)
+    return matches
+
+def parse_question(question, vocabulary=None):
+    """Turn a question into a search plan: an OData filter and sort order, or None for either.
+
+    ``vocabulary`` maps filterable string fields (category, supplier_name) to the tenant's values,
+    so filters use the exact stored spelling.
+    """
+    text = " ".join(question.lower().split())
+    vocabulary = vocabulary or {}
+    clauses = []
+    plan = {"filter": None, "order_by": None, "category": None, "supplier_name": None, "price_range": None}
+
+    for field, match in (("category", match_categories), ("supplier_name", match_vocabulary)):
+        matches = match(text, vocabulary.get(field, ()))
+        if matches:
+            plan[field] = matches[0]
+            clauses.append(f"{field} eq {_odata_literal(matches[0])}")
+
+    price_field = "cost_of_unit" if UNIT_PRICE_PATTERN.search(text) else "case_price"
+    for pattern, operators in PRICE_RANGES:
+        match = pattern.search(text)
+        if not match:
+            continue
+        groups = match.groups()
+        # "between $5 and 10" is a price range; "over 100 units" is not
+        if not any(groups[0::3]) and not any(groups[2::3]):
+            continue
+        amounts = [float(amount) for amount in groups[1::3]]
+        plan["price_range"] = (price_field, list(zip(operators, amounts)))
+        clauses.extend(f"{price_field} {operator} {amount:g}" for operator, amount in zip(operators, amounts))
+        break
+
+    for pattern, (field, direction) in SORT_INTENTS:
+        if pattern.search(text):
+            plan["order_by"] = f"{field.format(price=price_field)} {direction}"
+            break
+
+    if clauses:
+        plan["filter"] = " and ".join(clauses)
+    return plan
@@ -1,13 +1,36 @@
 # rag.py
 from database import CosmosDB
 from embeddings import EmbeddingGenerator
-from search import VectorStore
-from openai import OpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL
+from vector_backends import create_vector_store
+from search import load_live_version, versioned_index_name
+from index_snapshot import IndexSnapshot
+from vector_snapshot import snapshot_exists
+from answer_cache import SemanticAnswerCache
+from clients import get_openai_client
+from hybrid import rerank, sort_results
+from query_parser import parse_question
+from inventory_table import InventoryTable
+from fast_path import answer_directly
+from token_budget import count_tokens, count_message_tokens, pack
+from rate_limiter import create_with_limits, get_rate_limiter
+from deadline import with_retries, DeadlineExceeded
+from config import (
+    OPENAI_MODEL,
+    HYBRID_SEARCH,
+    SEARCH_CANDIDATES,
+    PROMPT_TOP_K,
+    PROMPT_CONTEXT_TOKENS,
+    COMPLETION_MAX_TOKENS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE
+)
+import asyncio
 import uuid
+import hashlib
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import json
+import re
 
 # Configure logging
 logging.basicConfig(
@@ -16,30 +39,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RAGAssistant")
 
+# Questions about totals and breakdowns, which retrieved items alone cannot answer
+AGGREGATE_QUESTION_PATTERN = re.compile(r"\b(total|value|worth|spend|spending|categor(?:y|ies)|suppliers?|overall|breakdown)\b", re.IGNORECASE)
+
+NO_RESULTS_MESSAGE = "I couldn't find any relevant inventory information to answer your question. Please try rephrasing or ask about specific inventory items."
+
 class RAGAssistant:
     def __init__(self, user_id):
         logger.info(f"Initializing RAGAssistant for user {user_id}")
         self.user_id = user_id
         self.cosmos_db = CosmosDB()
         self.embedding_generator = EmbeddingGenerator()
-        self.vector_store = VectorStore(user_id)
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        # Embeds questions at the live index's dimensions while a dimension migration is pending
+        self.live_embedding_generator = None
+        self.vector_store = create_vector_store(user_id)
+        self.snapshot = IndexSnapshot(self.vector_store.index_name)
+        self.answer_cache = SemanticAnswerCache()
+        self.openai_client = get_openai_client()
+        # Items of the latest indexed inventory, for answers that need no completion
+        self.inventory_table = None
         
-    @retry(
-        stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((ValueError, ConnectionError))
-    )
-    async def _generate_embedding_with_retry(self, text):
-        """Generate embedding with improved retry logic."""
+    async def connect(self):
+        """Connect to the user's live index, if there is one, and track its document snapshot."""
+        connected = await self.vector_store.connect_to_live_index()
+        self.snapshot = IndexSnapshot(self.vector_store.index_name)
+        return connected
+
+    async def _follow_live_index(self):
+        """Reconnect if another worker swapped the user's live index since this one connected.
+
+        Otherwise this worker would keep querying a retired version until it is garbage-collected,
+        and refresh it from a document snapshot that no longer exists.
+        """
+        version = load_live_version(self.user_id)
+        if version is None or version == self.vector_store.version:
+            return
+        rebuild = self.vector_store.rebuild
+        if rebuild and rebuild["state"] == "building":
+            return
+        logger.info(f"Live index for user {self.user_id} moved to version {version}, reconnecting")
         try:
-            logger.info(f"Generating embedding for text (length: {len(text)})")
-            embedding = await self.embedding_generator.generate_embedding(text)
-            logger.info(f"Generated embedding dimensions: {len(embedding)}")
-            return embedding
-        except Exception as e:
-            logger.error(f"Error generating embedding: {str(e)}")
+            await self.connect()
+        except DeadlineExceeded:
             raise
+        except Exception as e:
+            logger.warning(f"Could not reconnect to the live index, keeping {self.vector_store.index_name}: {str(e)}")
+
+    def _question_embedding_generator(self):
+        """The generator whose vectors match the live index, or None if none can produce its dimensions.
+
+        Until a dimension migration swaps in the rebuilt index, the live index still holds vectors
+        of the old dimensions, so questions are embedded at those (cached under their own model key).
+        """
+        dimensions = self.vector_store.dimensions
+        if dimensions == self.embedding_generator.expected_dim:
+            return self.embedding_generator
+        if self.live_embedding_generator is None or self.live_embedding_generator.expected_dim != dimensions:
+            try:
+                self.live_embedding_generator = EmbeddingGenerator(dimensions)
+            except ValueError:
+                logger.warning(f"Cannot embed questions at the live index's {dimensions} dimensions, using keyword search")
+                return None
+        return self.live_embedding_generator
+
+    async def _embed_question(self, user_question):
+        """Embed a question for the live index, or return None when only keyword search can serve it."""
+        generator = self._question_embedding_generator()
+        if generator is None:
+            return None
+        return await generator.generate_embedding(user_question)
+
+    def _index_stamp(self):
+        """Identify the indexed inventory across workers: the live index and when its documents last changed."""
+        version = load_live_version(self.user_id)
+        index_name = self.vector_store.index_name if version is None else versioned_index_name(self.user_id, version)
+        return index_name, IndexSnapshot(index_name).stamp()
 
     def _create_item_content(self, item):
         """Create rich, searchable content for an inventory item with improved structure."""
@@ -90,167 +164,521 @@ class RAGAssistant:
             # Return a minimal content to avoid complete failure
             return f"Item: {item.get('Inventory Item Name', 'Unknown Item')}"
 
-    async def index_inventory_items(self, inventory_list):
-        """Process and index inventory items with improved error handling."""
-        vector_documents = []
-        logger.info(f"Processing {len(inventory_list)} inventory documents")
-        
-        if not inventory_list:
-            logger.error("No inventory documents found")
-            raise ValueError("No inventory documents found")
-            
-        inventory_doc = inventory_list[0]
-        items = inventory_doc.get('items', [])
-        
+    def _document_id(self, item):
+        """Derive a stable document id from the supplier and item number."""
+        supplier_name = item.get('Supplier Name', '')
+        item_number = item.get('Item Number') or item.get('Inventory Item Name', '')
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{supplier_name}/{item_number}"))
+
+    def _build_document(self, item, content):
+        """Map an inventory item onto the search index fields (without the vector)."""
+        return {
+            'id': self._document_id(item),
+            'userId': self.user_id,
+            'supplier_name': item.get('Supplier Name', ''),
+            'inventory_item_name': item.get('Inventory Item Name', ''),
+            'item_name': item.get('Item Name', ''),
+            'item_number': item.get('Item Number', ''),
+            'quantity_in_case': float(item.get('Quantity In a Case', 0)),
+            'total_units': float(item.get('Total Units', 0)),
+            'case_price': float(item.get('Case Price', 0)),
+            'cost_of_unit': float(item.get('Cost of a Unit', 0)),
+            'category': item.get('Category', ''),
+            'measured_in': item.get('Measured In', ''),
+            'catch_weight': item.get('Catch Weight', ''),
+            'priced_by': item.get('Priced By', ''),
+            'splitable': item.get('Splitable', ''),
+            'content': content
+        }
+
+    @staticmethod
+    def _document_fingerprint(document):
+        """Hash every indexed field except the vector so any change is detected."""
+        fields = {key: value for key, value in document.items() if key != 'content_vector'}
+        payload = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _item_documents(self, inventory_doc, with_content=True):
+        """Yield index documents (without vectors) for the items of one Cosmos inventory document."""
+        items = inventory_doc.get('items') or []
         if not items:
-            logger.warning("Inventory document contains no items")
-            return
-        
-        logger.info(f"Processing {len(items)} individual inventory items")
+            logger.warning(f"Inventory document {inventory_doc.get('id')} contains no items")
         
         for i, item in enumerate(items):
             try:
-                # Create rich content
-                content = self._create_item_content(item)
-                
-                # Generate embedding
-                embedding = await self._generate_embedding_with_retry(content)
-                
-                # Create document with correct field mapping
-                vector_doc = {
-                    'id': str(uuid.uuid4()),
-                    'userId': self.user_id,
-                    'supplier_name': item.get('Supplier Name', ''),
-                    'inventory_item_name': item.get('Inventory Item Name', ''),
-                    'item_name': item.get('Item Name', ''),
-                    'item_number': item.get('Item Number', ''),
-                    'quantity_in_case': float(item.get('Quantity In a Case', 0)),
-                    'total_units': float(item.get('Total Units', 0)),
-                    'case_price': float(item.get('Case Price', 0)),
-                    'cost_of_unit': float(item.get('Cost of a Unit', 0)),
-                    'category': item.get('Category', ''),
-                    'measured_in': item.get('Measured In', ''),
-                    'catch_weight': item.get('Catch Weight', ''),
-                    'priced_by': item.get('Priced By', ''),
-                    'splitable': item.get('Splitable', ''),
-                    'content': content,
-                    'content_vector': embedding
-                }
-                
-                vector_documents.append(vector_doc)
-                logger.info(f"Successfully processed item {i+1}/{len(items)}: {item.get('Inventory Item Name')}")
-                
+                content = self._create_item_content(item) if with_content else ""
+                yield self._build_document(item, content)
             except Exception as e:
-                logger.error(f"Error processing item {i}: {str(e)}")
+                logger.error(f"Error processing item {i} of document {inventory_doc.get('id')}: {str(e)}")
                 # Continue with next item instead of failing completely
                 continue
+
+    @staticmethod
+    async def _iterate(inventory):
+        """Iterate a list or an async stream of Cosmos inventory documents."""
+        if hasattr(inventory, '__aiter__'):
+            async for inventory_doc in inventory:
+                yield inventory_doc
+        else:
+            for inventory_doc in inventory or []:
+                yield inventory_doc
+
+    @staticmethod
+    async def _run_stages(*stages):
+        """Run pipeline stages concurrently; if one fails, cancel the rest and re-raise."""
+        tasks = [asyncio.create_task(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def load_inventory_table(self):
+        """Load the item table from Cosmos DB for an assistant whose index already exists."""
+        rows = {}
+        async for inventory_doc in self.cosmos_db.iter_user_documents(self.user_id):
+            for document in self._item_documents(inventory_doc, with_content=False):
+                rows.setdefault(document['id'], document)
+        if rows:
+            self.inventory_table = InventoryTable(rows.values())
+            logger.info(f"Loaded {len(self.inventory_table)} items into the inventory table")
+
+    async def index_inventory_items(self, inventory, snapshot=None, index_name=None):
+        """Index every supplier document's items, embedding and uploading only what changed since the snapshot.
+
+        ``inventory`` is a list or an async stream of Cosmos documents. Documents flow through
+        fetch -> build -> embed -> upload stages joined by bounded queues, so only a few batches
+        of content and vectors are held at once and uploads start while later items are embedding.
+        """
+        previous = dict(snapshot.documents) if snapshot is not None else {}
+        current = {}
+        # Item fields (without content or vectors) for the inventory table
+        rows = {}
+        stats = {"documents": 0, "changed": 0, "uploaded": 0, "failed": 0}
+        
+        inventory_docs = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        embed_batches = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        upload_batches = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        
+        async def fetch():
+            async for inventory_doc in self._iterate(inventory):
+                stats["documents"] += 1
+                await inventory_docs.put(inventory_doc)
+            await inventory_docs.put(None)
+        
+        async def build():
+            batch = []
+            while (inventory_doc := await inventory_docs.get()) is not None:
+                for document in self._item_documents(inventory_doc):
+                    doc_id = document['id']
+                    if doc_id in rows:
+                        logger.warning(f"Duplicate item for id {doc_id}, keeping the first")
+                        continue
+                    rows[doc_id] = {key: value for key, value in document.items() if key != 'content'}
+                    
+                    fingerprint = self._document_fingerprint(document)
+                    if previous.get(doc_id) == fingerprint:
+                        current[doc_id] = fingerprint
+                        continue
+                    stats["changed"] += 1
+                    batch.append((document, fingerprint))
+                    if len(batch) >= EMBEDDING_BATCH_SIZE:
+                        await embed_batches.put(batch)
+                        batch = []
+                if index_name:
+                    self.vector_store.set_rebuild_total(len(rows))
+            if batch:
+                await embed_batches.put(batch)
+            for _ in range(EMBEDDING_MAX_CONCURRENCY):
+                await embed_batches.put(None)
+        
+        async def embed_worker():
+            while (batch := await embed_batches.get()) is not None:
+                embeddings = await self.embedding_generator.generate_embeddings(
+                    [document['content'] for document, _ in batch], max_concurrency=1
+                )
+                vector_documents = []
+                for (document, fingerprint), embedding in zip(batch, embeddings):
+                    if embedding is None:
+                        logger.error(f"Error processing item {document['id']}: no embedding generated")
+                        stats["failed"] += 1
+                        # Keep the old fingerprint so the item is retried on the next refresh
+                        if document['id'] in previous:
+                            current[document['id']] = previous[document['id']]
+                        continue
+                    document['content_vector'] = embedding
+                    vector_documents.append((document, fingerprint))
+                if vector_documents:
+                    await upload_batches.put(vector_documents)
+        
+        async def embed():
+            await asyncio.gather(*(embed_worker() for _ in range(EMBEDDING_MAX_CONCURRENCY)))
+            await upload_batches.put(None)
+        
+        async def upload():
+            while (batch := await upload_batches.get()) is not None:
+                logger.info(f"Upserting {len(batch)} documents to vector store")
+                indexed = set(await self.vector_store.add_documents(
+                    [document for document, _ in batch], index_name=index_name
+                ))
+                for document, fingerprint in batch:
+                    if document['id'] in indexed:
+                        current[document['id']] = fingerprint
+                    else:
+                        stats["failed"] += 1
+                        # Keep the old fingerprint so the item is retried on the next refresh
+                        if document['id'] in previous:
+                            current[document['id']] = previous[document['id']]
+                stats["uploaded"] += len(indexed)
         
-        if vector_documents:
-            logger.info(f"Adding {len(vector_documents)} documents to vector store")
-            await self.vector_store.add_documents(vector_documents)
+        await self._run_stages(fetch(), build(), embed(), upload())
+        
+        if not stats["documents"]:
+            logger.error("No inventory documents found")
+            raise ValueError("No inventory documents found")
+        
+        removed_ids = [doc_id for doc_id in previous if doc_id not in rows]
+        logger.info(
+            f"Indexed {stats['documents']} inventory documents: {stats['changed']} new or changed "
+            f"({stats['uploaded']} uploaded, {stats['failed']} failed), "
+            f"{len(rows) - stats['changed']} unchanged, {len(removed_ids)} removed"
+        )
+        
+        if removed_ids:
+            logger.info(f"Deleting {len(removed_ids)} removed documents from vector store")
+            await self.vector_store.delete_documents(removed_ids)
+        
+        # Write the memory-mapped vector snapshot so other workers and restarts warm from disk
+        if stats["changed"] or removed_ids or not snapshot_exists(index_name or self.vector_store.index_name):
+            await self.vector_store.persist_snapshot(index_name)
+        
+        if snapshot is not None:
+            snapshot.documents = current
+            snapshot.save()
+        
+        if self.inventory_table is None:
+            self.inventory_table = InventoryTable(rows.values())
         else:
-            logger.warning("No documents were successfully processed for indexing")
+            self.inventory_table.update(rows.values())
+        return current
 
     async def initialize(self):
         """Initialize the RAG system with better error handling and logging."""
         try:
-            # Get user inventory
-            logger.info(f"Fetching inventory data for user {self.user_id}")
-            inventory = await self.cosmos_db.get_user_documents(self.user_id)
-            
-            if not inventory:
-                logger.error(f"No inventory found for user {self.user_id}")
-                raise ValueError(f"No inventory found for user {self.user_id}")
-            
-            logger.info(f"Retrieved {len(inventory)} inventory documents")
-            
-            # Create or update search index
-            logger.info("Creating/updating search index")
-            await self.vector_store.create_index()
-            
-            # Index inventory items
-            logger.info("Indexing inventory items")
-            await self.index_inventory_items(inventory)
+            # Stream the user's inventory into a fresh index version and swap it in when complete
+            logger.info(f"Building search index from inventory data for user {self.user_id}")
+            await self.rebuild_index(self.cosmos_db.iter_user_documents(self.user_id))
             
+            self.answer_cache.invalidate()
             logger.info("Initialization completed successfully")
             
         except Exception as e:
             logger.error(f"Error during initialization: {str(e)}")
             raise
 
-    async def query(self, user_question, top_k=5):
-        """Improved query processing with clearer prompt structure and error handling."""
+    async def rebuild_index(self, inventory):
+        """Fully rebuild into a shadow index version, then swap it live without downtime.
+
+        The rebuild total grows as the inventory stream is read.
+        """
+        shadow_index_name = await self.vector_store.begin_rebuild()
+        shadow_snapshot = IndexSnapshot(shadow_index_name)
+        
+        try:
+            logger.info(f"Indexing inventory items into {shadow_index_name}")
+            await self.index_inventory_items(inventory, shadow_snapshot, index_name=shadow_index_name)
+            
+            await self.vector_store.complete_rebuild()
+        except Exception as e:
+            logger.error(f"Error rebuilding index, keeping current live index: {str(e)}")
+            await self.vector_store.abort_rebuild()
+            shadow_snapshot.delete()
+            raise
+        
+        retired_snapshot = self.snapshot
+        self.snapshot = shadow_snapshot
+        if retired_snapshot.index_name != shadow_index_name:
+            retired_snapshot.delete()
+
+    async def _search_plan(self, user_question):
+        """Parse a question into a filter and sort order using the tenant's categories and suppliers."""
+        vocabulary = {}
+        for field in ("category", "supplier_name"):
+            try:
+                vocabulary[field] = await self.vector_store.field_values(field)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"Could not load {field} values for query parsing: {str(e)}")
+        
+        plan = parse_question(user_question, vocabulary)
+        if plan["filter"] or plan["order_by"]:
+            logger.info(f"Query plan: filter={plan['filter']!r}, order_by={plan['order_by']!r}")
+        return plan
+
+    async def _retrieve(self, user_question, question_embedding, top_k):
+        """Fetch the inventory items most relevant to a question.
+
+        Categories, suppliers and price ranges in the question become filters. Ranking questions
+        ("cheapest", "lowest stock") sort the filtered items when a filter scopes them; without one
+        ("cheapest cheese") the relevant items are found by hybrid search first and then sorted.
+        In hybrid mode a wider candidate set is retrieved by keyword and vector search, then
+        re-ranked locally so only the best top_k reach the prompt. Without a question embedding
+        only the keyword half of the search runs.
+        """
+        plan = await self._search_plan(user_question)
+        filter_condition = plan["filter"]
+        order_by = plan["order_by"]
+        
+        if order_by and filter_condition:
+            results = await self.vector_store.search(
+                question_embedding, top_k, filter_condition, order_by=order_by
+            )
+            if results:
+                return results
+        
+        for condition in ([filter_condition, None] if filter_condition else [None]):
+            if not HYBRID_SEARCH and not order_by and question_embedding is not None:
+                logger.info(f"Searching for top {top_k} relevant items")
+                results = await self.vector_store.search(question_embedding, top_k, condition)
+            else:
+                candidates = max(top_k, SEARCH_CANDIDATES)
+                logger.info(f"Hybrid search for {candidates} candidates, keeping top {top_k} after re-ranking")
+                results = await self.vector_store.search(
+                    question_embedding, candidates, condition, query_text=user_question
+                )
+                results = rerank(user_question, results, top_k)
+            if results:
+                return sort_results(results, order_by) if order_by else results
+            if condition:
+                logger.info("No items matched the parsed filter, searching without it")
+        return results
+
+    def _build_messages(self, user_question, search_results, budget=PROMPT_CONTEXT_TOKENS):
+        """Build the chat messages for a question and its retrieved items.
+
+        Inventory totals (for aggregate questions) and retrieved items share a token budget;
+        totals get at most half of it and items fill the rest, best match first.
+        """
+        # Questions about totals and breakdowns also get the table's precomputed aggregates
+        inventory_summary = None
+        if self.inventory_table is not None and len(self.inventory_table) and AGGREGATE_QUESTION_PATTERN.search(user_question):
+            summary_lines, summary_tokens = pack(self.inventory_table.summary().split("\n"), budget // 2)
+            inventory_summary = "\n".join(summary_lines)
+            budget -= summary_tokens
+        
+        # Format the search results for the prompt
+        formatted_results = self._format_search_results(search_results, budget)
+        
+        # Construct a better prompt with clear sections
+        prompt = self._construct_prompt(user_question, formatted_results, inventory_summary)
+        
+        return [
+            {
+                "role": "system", 
+                "content": "You are a helpful restaurant inventory assistant that provides accurate information about inventory items, prices, and quantities. Answer questions based only on the inventory data provided. If the data doesn't contain the information needed, acknowledge that limitation. Format your response in a clear, professional manner."
+            },
+            {"role": "user", "content": prompt}
+        ]
+
+    async def query(self, user_question, top_k=PROMPT_TOP_K):
+        """Answer a question, returning a dict with the response text, whether it came from the cache,
+        whether it was answered directly from the inventory table and, for completions, token usage."""
         try:
             logger.info(f"Processing query: '{user_question}'")
+            await self._follow_live_index()
+            
+            # Answers cached before any worker re-indexed are misses
+            index_stamp = self._index_stamp()
+            cached_answer = self.answer_cache.lookup_text(user_question, index_stamp)
+            if cached_answer is not None:
+                return {"response": cached_answer, "cached": True}
+            
+            direct_answer = answer_directly(user_question, self.inventory_table)
+            if direct_answer is not None:
+                return {"response": direct_answer, "cached": False, "fast_path": True}
             
             # Generate embedding for the question
-            question_embedding = await self._generate_embedding_with_retry(user_question)
+            question_embedding = await self._embed_question(user_question)
+            
+            if question_embedding is not None:
+                cached_answer = self.answer_cache.lookup(question_embedding, index_stamp)
+            if cached_answer is not None:
+                return {"response": cached_answer, "cached": True}
             
-            # Search for relevant inventory items
-            logger.info(f"Searching for top {top_k} relevant items")
-            search_results = await self.vector_store.search(question_embedding, top_k)
+            search_results = await self._retrieve(user_question, question_embedding, top_k)
             
             if not search_results:
                 logger.warning("No relevant inventory items found")
-                return "I couldn't find any relevant inventory information to answer your question. Please try rephrasing or ask about specific inventory items."
-            
-            # Format the search results for the prompt
-            formatted_results = self._format_search_results(search_results)
-            
-            # Construct a better prompt with clear sections
-            prompt = self._construct_prompt(user_question, formatted_results)
+                return {"response": NO_RESULTS_MESSAGE, "cached": False}
             
             # Generate response
-            logger.info("Generating response with fine-tuned model")
-            response = self.openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful restaurant inventory assistant that provides accurate information about inventory items, prices, and quantities. Answer questions based only on the inventory data provided. If the data doesn't contain the information needed, acknowledge that limitation. Format your response in a clear, professional manner."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,  # Lower temperature for more consistent responses
-                max_tokens=1000
+            messages = self._build_messages(user_question, search_results)
+            prompt_tokens = count_message_tokens(messages)
+            logger.info(f"Generating response with fine-tuned model (~{prompt_tokens} prompt tokens)")
+            response = await with_retries(
+                lambda: create_with_limits(
+                    self.openai_client.chat.completions,
+                    OPENAI_MODEL,
+                    prompt_tokens + COMPLETION_MAX_TOKENS,
+                    messages=messages,
+                    temperature=0.3,  # Lower temperature for more consistent responses
+                    max_tokens=COMPLETION_MAX_TOKENS
+                ),
+                "completion"
             )
             
             logger.info("Response generated successfully")
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            if question_embedding is not None:
+                self.answer_cache.put(user_question, question_embedding, answer, index_stamp)
+            usage = self._token_usage(getattr(response, 'usage', None), messages, answer)
+            return {"response": answer, "cached": False, "usage": usage}
             
+        except DeadlineExceeded:
+            # Timeouts reach the API, which fails the request rather than apologising
+            raise
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
             # Provide a graceful error message to the user
-            return f"I encountered an issue while processing your question. Please try again or contact support if the problem persists."
-    
-    def _format_search_results(self, search_results):
-        """Format search results in a clear, structured way for the prompt."""
-        formatted_items = []
+            return {
+                "response": f"I encountered an issue while processing your question. Please try again or contact support if the problem persists.",
+                "cached": False
+            }
+
+    async def query_stream(self, user_question, top_k=PROMPT_TOP_K):
+        """Stream a response as events: retrieval metadata first, then tokens as they arrive,
+        then the completion's token usage.
+
+        Closing this generator early (e.g. on client disconnect) closes the upstream completion stream.
+        """
+        logger.info(f"Processing streaming query: '{user_question}'")
+        await self._follow_live_index()
         
-        for i, item in enumerate(search_results):
-            # Extract key information
-            inventory_item_name = item.get('inventory_item_name', 'Unknown')
-            category = item.get('category', 'Unknown')
-            cost = item.get('cost_of_unit', 0)
-            total_units = item.get('total_units', 0)
-            case_price = item.get('case_price', 0)
-            
-            # Format as structured data
-            formatted_item = (
-                f"Item {i+1}: {inventory_item_name}\n"
-                f"  Category: {category}\n"
-                f"  Unit Cost: ${cost}\n"
-                f"  Total Units Available: {total_units}\n"
-                f"  Case Price: ${case_price}\n"
-                f"  Details: {item.get('content', '')}"
-            )
-            
-            formatted_items.append(formatted_item)
+        index_stamp = self._index_stamp()
+        cached_answer = self.answer_cache.lookup_text(user_question, index_stamp)
+        if cached_answer is None:
+            direct_answer = answer_directly(user_question, self.inventory_table)
+            if direct_answer is not None:
+                yield {"event": "metadata", "data": {"cached": False, "fast_path": True, "result_count": 0, "items": []}}
+                yield {"event": "token", "data": {"text": direct_answer}}
+                return
         
-        return "\n\n".join(formatted_items)
+        question_embedding = None
+        if cached_answer is None:
+            question_embedding = await self._embed_question(user_question)
+            if question_embedding is not None:
+                cached_answer = self.answer_cache.lookup(question_embedding, index_stamp)
+        
+        if cached_answer is not None:
+            yield {"event": "metadata", "data": {"cached": True, "result_count": 0, "items": []}}
+            yield {"event": "token", "data": {"text": cached_answer}}
+            return
+        
+        search_results = await self._retrieve(user_question, question_embedding, top_k)
+        
+        yield {
+            "event": "metadata",
+            "data": {
+                "cached": False,
+                "result_count": len(search_results),
+                "items": [
+                    {
+                        "inventory_item_name": item.get('inventory_item_name'),
+                        "category": item.get('category'),
+                        "supplier_name": item.get('supplier_name')
+                    }
+                    for item in search_results
+                ]
+            }
+        }
+        
+        if not search_results:
+            logger.warning("No relevant inventory items found")
+            yield {"event": "token", "data": {"text": NO_RESULTS_MESSAGE}}
+            return
+        
+        messages = self._build_messages(user_question, search_results)
+        prompt_tokens = count_message_tokens(messages)
+        logger.info(f"Streaming response with fine-tuned model (~{prompt_tokens} prompt tokens)")
+        stream = await with_retries(
+            lambda: create_with_limits(
+                self.openai_client.chat.completions,
+                OPENAI_MODEL,
+                prompt_tokens + COMPLETION_MAX_TOKENS,
+                messages=messages,
+                temperature=0.3,  # Lower temperature for more consistent responses
+                max_tokens=COMPLETION_MAX_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            "completion"
+        )
+        
+        answer_parts = []
+        reported_usage = None
+        try:
+            async for chunk in stream:
+                # The final chunk carries the token usage and no choices
+                if getattr(chunk, 'usage', None):
+                    reported_usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    answer_parts.append(text)
+                    yield {"event": "token", "data": {"text": text}}
+            logger.info("Streamed response successfully")
+            answer = "".join(answer_parts)
+            if question_embedding is not None:
+                self.answer_cache.put(user_question, question_embedding, answer, index_stamp)
+            if reported_usage is not None:
+                get_rate_limiter().refund(OPENAI_MODEL, prompt_tokens + COMPLETION_MAX_TOKENS - reported_usage.total_tokens)
+            yield {"event": "usage", "data": self._token_usage(reported_usage, messages, answer)}
+        finally:
+            # Stops generation upstream if the consumer went away mid-stream
+            await stream.close()
     
-    def _construct_prompt(self, question, formatted_results):
+    @staticmethod
+    def _token_usage(reported, messages, answer):
+        """Prompt and completion token counts, as reported by the API or else counted locally."""
+        if reported is not None:
+            return {"prompt_tokens": reported.prompt_tokens, "completion_tokens": reported.completion_tokens}
+        return {"prompt_tokens": count_message_tokens(messages), "completion_tokens": count_tokens(answer)}
+
+    @staticmethod
+    def _format_item(number, item):
+        """One line per item stating each field once; empty fields are left out."""
+        name = item.get('inventory_item_name') or item.get('item_name') or 'Unknown'
+        measured_in = item.get('measured_in') or 'units'
+        parts = [f"Item {number}: {name}"]
+        if item.get('item_name') and item['item_name'] != name:
+            parts.append(f"Product: {item['item_name']}")
+        for label, field in (("Supplier", "supplier_name"), ("Item #", "item_number"), ("Category", "category")):
+            if item.get(field):
+                parts.append(f"{label}: {item[field]}")
+        case = f"Case Price: ${float(item.get('case_price') or 0):.2f}"
+        if item.get('quantity_in_case'):
+            case += f" for {float(item['quantity_in_case']):g} {measured_in}"
+        if item.get('priced_by'):
+            case += f" (priced {item['priced_by']})"
+        parts.append(case)
+        unit = f" (measured in {item['measured_in']})" if item.get('measured_in') else ""
+        parts.append(f"Unit Cost: ${float(item.get('cost_of_unit') or 0):.2f}{unit}")
+        parts.append(f"Total Units Available: {float(item.get('total_units') or 0):g} {measured_in}")
+        return " | ".join(parts)
+
+    def _format_search_results(self, search_results, budget=PROMPT_CONTEXT_TOKENS):
+        """Format search results, best first, as many as fit in the token budget."""
+        lines = [self._format_item(i + 1, item) for i, item in enumerate(search_results)]
+        packed, _ = pack(lines, budget)
+        return "\n".join(packed)
+    
+    def _construct_prompt(self, question, formatted_results, inventory_summary=None):
         """Construct a clear prompt with explicit instructions."""
+        summary_section = f"\nINVENTORY TOTALS:\n{inventory_summary}\n" if inventory_summary else ""
         prompt = f"""
 I need information from my restaurant inventory to answer this question:
 
@@ -259,7 +687,7 @@ QUESTION:
 
 RELEVANT INVENTORY DATA:
 {formatted_results}
-
+{summary_section}
 Based ONLY on the inventory data above, please provide a detailed answer to my question.
 If the data doesn't contain enough information to answer completely, please acknowledge that limitation.
 Focus on providing practical, actionable insights for restaurant inventory management.
@@ -270,22 +698,24 @@ Focus on providing practical, actionable insights for restaurant inventory manag
         """Re-index user documents (for refreshing the index)."""
         try:
             logger.info(f"Re-indexing documents for user {self.user_id}")
+            await self._follow_live_index()
             
-            # Get updated inventory
-            inventory = await self.cosmos_db.get_user_documents(self.user_id)
-            
-            if not inventory:
-                logger.error(f"No inventory found for user {self.user_id}")
-                raise ValueError(f"No inventory found for user {self.user_id}")
-            
-            # Delete and recreate index
-            logger.info("Recreating search index")
-            await self.vector_store.create_index()
+            # Stream the updated inventory from Cosmos DB
+            inventory = self.cosmos_db.iter_user_documents(self.user_id)
             
-            # Index inventory items
-            logger.info("Indexing updated inventory items")
-            await self.index_inventory_items(inventory)
+            # Only a missing index or snapshot, or changed embedding dimensions, require a full rebuild
+            if self.vector_store.needs_migration():
+                logger.info("Live index has different embedding dimensions, rebuilding search index")
+                await self.rebuild_index(inventory)
+            elif not self.vector_store.search_client or not self.snapshot.load():
+                logger.info("No previous snapshot of a live index, rebuilding search index")
+                await self.rebuild_index(inventory)
+            else:
+                # Index new or changed items and remove deleted ones
+                logger.info("Indexing updated inventory items")
+                await self.index_inventory_items(inventory, self.snapshot)
             
+            self.answer_cache.invalidate()
             logger.info("Re-indexing completed successfully")
             return True
             
@@ -0,0 +1,232 @@
+# rate_limiter.py
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+import openai
+from deadline import remaining, expired
+from config import (
+    OPENAI_EMBEDDING_MODEL,
+    CHAT_REQUESTS_PER_MINUTE,
+    CHAT_TOKENS_PER_MINUTE,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE,
+    RATE_LIMIT_INTERACTIVE_RESERVE
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("RateLimiter")
+
+# Priorities: lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# How often queued callers that are not at the head re-check the bucket
+POLL_INTERVAL_SECONDS = 0.05
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset header such as "20ms", "1s" or "6m0s"; None if absent."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """Requests and tokens per minute for one model.
+
+    Both budgets refill continuously; rate-limit response headers correct the limits and
+    the remaining budget, and a 429 pauses the bucket until the reported reset.
+    """
+
+    def __init__(self, model, requests_per_minute, tokens_per_minute, reserve=RATE_LIMIT_INTERACTIVE_RESERVE):
+        self.model = model
+        self.request_limit = float(requests_per_minute)
+        self.token_limit = float(tokens_per_minute)
+        self.requests = self.request_limit
+        self.tokens = self.token_limit
+        # Fraction of each budget that background work leaves for interactive calls
+        self.reserve = reserve
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        # Heap of (priority, sequence) for callers waiting on this bucket
+        self.waiters = []
+        self.throttled = 0
+
+    def refill(self, now=None):
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.requests = min(self.request_limit, self.requests + elapsed * self.request_limit / 60)
+        self.tokens = min(self.token_limit, self.tokens + elapsed * self.token_limit / 60)
+
+    def wait_time(self, tokens, priority, now=None):
+        """Seconds until a call of ``tokens`` at ``priority`` fits; 0 if it fits now."""
+        now = time.monotonic() if now is None else now
+        if now < self.paused_until:
+            return self.paused_until - now
+        reserve = self.reserve if priority == BACKGROUND else 0.0
+        # A single call larger than the whole budget waits for a full bucket rather than forever
+        tokens = min(tokens, self.token_limit * (1 - reserve))
+        missing_requests = 1 + reserve * self.request_limit - self.requests
+        missing_tokens = tokens + reserve * self.token_limit - self.tokens
+        return max(
+            0.0,
+            missing_requests * 60 / self.request_limit,
+            missing_tokens * 60 / self.token_limit
+        )
+
+    def take(self, tokens):
+        self.requests -= 1
+        self.tokens -= tokens
+
+    def refund(self, tokens):
+        """Return tokens reserved for a call that used fewer."""
+        self.tokens = min(self.token_limit, self.tokens + tokens)
+
+    def update(self, headers, throttled=False):
+        """Adopt the limits and remaining budget reported by the API."""
+        headers = headers or {}
+        for attribute, header in (("request_limit", "x-ratelimit-limit-requests"), ("token_limit", "x-ratelimit-limit-tokens")):
+            value = headers.get(header)
+            if value:
+                setattr(self, attribute, float(value))
+        # Responses arrive out of order, so only ever lower the local view
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests:
+            self.requests = min(self.requests, float(remaining_requests))
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens:
+            self.tokens = min(self.tokens, float(remaining_tokens))
+
+        if throttled:
+            self.throttled += 1
+            delay = max(
+                parse_duration(headers.get("retry-after")) or 0,
+                parse_duration(headers.get("x-ratelimit-reset-requests")) if self.requests < 1 else 0,
+                parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0,
+                1.0
+            )
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.tokens = min(self.tokens, 0.0)
+            logger.warning(f"Rate limited on {self.model}, pausing for {delay:.1f}s")
+
+class RateLimitScheduler:
+    """Shares each model's OpenAI rate limits between interactive queries and background indexing.
+
+    Callers wait in priority order per model: interactive calls go first and may use the whole
+    budget, background calls only run while a reserve is left for interactive traffic.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self._sequence = itertools.count()
+
+    def bucket(self, model):
+        bucket = self.buckets.get(model)
+        if bucket is None:
+            if model == OPENAI_EMBEDDING_MODEL:
+                bucket = TokenBucket(model, EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_TOKENS_PER_MINUTE)
+            else:
+                bucket = TokenBucket(model, CHAT_REQUESTS_PER_MINUTE, CHAT_TOKENS_PER_MINUTE)
+            self.buckets[model] = bucket
+        return bucket
+
+    async def acquire(self, model, tokens, priority=INTERACTIVE):
+        """Wait until a call of ``tokens`` estimated tokens may be sent, then reserve them.
+
+        Raises DeadlineExceeded as soon as the wait is known to outlast the current deadline.
+        """
+        bucket = self.bucket(model)
+        entry = (priority, next(self._sequence))
+        heapq.heappush(bucket.waiters, entry)
+        started = time.monotonic()
+        try:
+            while True:
+                bucket.refill()
+                if bucket.waiters[0] == entry:
+                    delay = bucket.wait_time(tokens, priority)
+                    if delay <= 0:
+                        heapq.heappop(bucket.waiters)
+                        bucket.take(tokens)
+                        break
+                else:
+                    delay = POLL_INTERVAL_SECONDS
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise expired("rate_limit_wait", f"{model} needs {delay:.1f}s, {max(left, 0):.1f}s left")
+                await asyncio.sleep(min(delay, 1.0))
+        except BaseException:
+            bucket.waiters.remove(entry)
+            heapq.heapify(bucket.waiters)
+            raise
+
+        waited = time.monotonic() - started
+        if waited > 1.0:
+            logger.info(
+                f"{'Interactive' if priority == INTERACTIVE else 'Background'} call to {model} "
+                f"waited {waited:.1f}s for rate limit budget"
+            )
+
+    def record(self, model, headers, throttled=False):
+        self.bucket(model).update(headers, throttled)
+
+    def refund(self, model, tokens):
+        if tokens > 0:
+            self.bucket(model).refund(tokens)
+
+    def stats(self):
+        return {
+            model: {
+                "requests_remaining": round(bucket.requests),
+                "tokens_remaining": round(bucket.tokens),
+                "request_limit": bucket.request_limit,
+                "token_limit": bucket.token_limit,
+                "waiting": len(bucket.waiters),
+                "throttled": bucket.throttled
+            }
+            for model, bucket in self.buckets.items()
+        }
+
+# Shared scheduler instance, created lazily and reused across all users
+_rate_limiter = None
+
+def get_rate_limiter():
+    """Return the shared rate limit scheduler."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimitScheduler()
+    return _rate_limiter
+
+async def create_with_limits(endpoint, model, estimated_tokens, priority=INTERACTIVE, **params):
+    """Call an OpenAI ``create`` endpoint once the model's budget allows, feeding back its rate-limit headers.
+
+    Tokens reserved beyond the reported usage are returned to the bucket.
+    """
+    limiter = get_rate_limiter()
+    await limiter.acquire(model, estimated_tokens, priority)
+    try:
+        raw = await endpoint.with_raw_response.create(model=model, **params)
+    except openai.RateLimitError as e:
+        limiter.record(model, e.response.headers, throttled=True)
+        raise
+    limiter.record(model, raw.headers)
+    response = raw.parse()
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None) is not None:
+        limiter.refund(model, estimated_tokens - usage.total_tokens)
+    return response
@@ -0,0 +1,85 @@
+# registry.py
+import logging
+import time
+from collections import OrderedDict
+from config import (
+    MAX_RESIDENT_ASSISTANTS,
+    ASSISTANT_IDLE_TTL_SECONDS
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("AssistantRegistry")
+
+class AssistantRegistry:
+    """Bounded registry of per-user RAG assistants with LRU and idle eviction.
+
+    Supports the dict operations main.py relies on (``in``, ``[]``, ``get``, ``del``).
+    """
+
+    def __init__(self, max_assistants=MAX_RESIDENT_ASSISTANTS, idle_ttl=ASSISTANT_IDLE_TTL_SECONDS):
+        logger.info(f"Initializing AssistantRegistry (max assistants: {max_assistants}, idle TTL: {idle_ttl}s)")
+        self.max_assistants = max_assistants
+        self.idle_ttl = idle_ttl
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        # user_id -> (assistant, last_used), least recently used first
+        self._assistants = OrderedDict()
+
+    def __contains__(self, user_id):
+        return user_id in self._assistants
+
+    def __len__(self):
+        return len(self._assistants)
+
+    def __getitem__(self, user_id):
+        assistant, _ = self._assistants[user_id]
+        self._touch(user_id, assistant)
+        return assistant
+
+    def get(self, user_id, default=None):
+        if user_id not in self._assistants:
+            return default
+        return self[user_id]
+
+    def __setitem__(self, user_id, assistant):
+        self._touch(user_id, assistant)
+        self.evict_idle()
+        while len(self._assistants) > self.max_assistants:
+            evicted_user_id, _ = self._assistants.popitem(last=False)
+            self.lru_evictions += 1
+            logger.info(f"Evicted least recently used assistant for user {evicted_user_id}")
+
+    def __delitem__(self, user_id):
+        del self._assistants[user_id]
+
+    def _touch(self, user_id, assistant):
+        self._assistants[user_id] = (assistant, time.monotonic())
+        self._assistants.move_to_end(user_id)
+
+    def evict_idle(self):
+        """Drop assistants that have not been used within the idle TTL."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = 0
+        while self._assistants:
+            user_id, (_, last_used) = next(iter(self._assistants.items()))
+            if last_used >= cutoff:
+                break
+            del self._assistants[user_id]
+            evicted += 1
+            logger.info(f"Evicted idle assistant for user {user_id}")
+        self.idle_evictions += evicted
+        return evicted
+
+    def stats(self):
+        """Return resident assistant and eviction counters."""
+        return {
+            "resident": len(self._assistants),
+            "max_resident": self.max_assistants,
+            "idle_ttl_seconds": self.idle_ttl,
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions
+        }
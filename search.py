@@ -1,8 +1,11 @@
 # search.py
+import asyncio
+import json
 import logging
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient
+import os
+import re
+import time
+import numpy as np
 from azure.search.documents.indexes.models import (
     SearchIndex,
     SimpleField,
@@ -12,12 +15,24 @@ from azure.search.documents.indexes.models import (
     VectorSearchProfile,
     SearchField,
 )
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ServiceRequestError, ServiceResponseError
+from clients import get_search_client, get_async_search_index_client
+from index_catalog import get_index_catalog
+from vector_index import LocalVectorIndex
+from hybrid import KEYWORD_SEARCH_FIELDS
+from vector_snapshot import delete_snapshot
+from deadline import with_retries, record_retry, is_retryable, RETRYABLE_STATUS_CODES
 from config import (
-    SEARCH_SERVICE_ENDPOINT,
-    SEARCH_SERVICE_KEY,
-    OPENAI_EMBEDDING_MODEL
+    OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    INDEX_SNAPSHOT_DIR,
+    INDEX_GC_GRACE_SECONDS,
+    SEARCH_FROM_SNAPSHOT,
+    SEARCH_UPLOAD_MAX_BYTES,
+    SEARCH_UPLOAD_MAX_DOCUMENTS,
+    SEARCH_UPLOAD_CONCURRENCY,
+    SEARCH_UPLOAD_MAX_RETRIES
 )
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 # Set up logging
 logging.basicConfig(
@@ -26,130 +41,509 @@ logging.basicConfig(
 )
 logger = logging.getLogger("VectorStore")
 
+# Fields returned with each search result
+SEARCH_SELECT_FIELDS = [
+    "inventory_item_name",
+    "item_name",
+    "category",
+    "case_price",
+    "cost_of_unit",
+    "total_units",
+    "measured_in",
+    "priced_by",
+    "quantity_in_case",
+    "supplier_name",
+    "item_number"
+]
+
+# Vector dimensions of indexes created before EMBEDDING_DIMENSIONS existed
+LEGACY_EMBEDDING_DIMENSIONS = 1536
+
+# Bumped when the index definition changes; older live indexes are migrated by a rebuild.
+# 2: item_number is searchable for hybrid keyword search
+# 3: category and supplier_name are facetable for query understanding
+INDEX_SCHEMA_VERSION = 3
+
+# Pending sweeps of retired index versions, across all users
+_gc_tasks = set()
+
+def user_index_pattern(user_id):
+    """Match the legacy index name and every versioned index name for a user."""
+    return re.compile(rf"^inventory-{re.escape(user_id)}(?:-v(\d+))?$")
+
+def versioned_index_name(user_id, version):
+    """Index name for a version; version 0 is the legacy unversioned index."""
+    base_index_name = f"inventory-{user_id}"
+    return base_index_name if version == 0 else f"{base_index_name}-v{version}"
+
+def live_state_path(user_id):
+    return os.path.join(INDEX_SNAPSHOT_DIR, f"inventory-{user_id}.live.json")
+
+def load_live_state(user_id):
+    """Read the persisted live index state, or an empty dict if it was never recorded."""
+    try:
+        with open(live_state_path(user_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Error reading live index state: {str(e)}")
+        return {}
+
+def load_live_version(user_id):
+    """Read the persisted live version, or None if it was never recorded."""
+    return load_live_state(user_id).get("version")
+
+def load_live_schema(user_id, version):
+    """(vector dimensions, schema version) of a live index version.
+
+    Indexes without a recorded state predate both settings.
+    """
+    state = load_live_state(user_id)
+    if state.get("version") != version:
+        return LEGACY_EMBEDDING_DIMENSIONS, 1
+    return state.get("dimensions") or LEGACY_EMBEDDING_DIMENSIONS, state.get("schema_version", 1)
+
+def _write_live_state(user_id, state):
+    state_path = live_state_path(user_id)
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def save_live_version(user_id, index_name, version, dimensions=EMBEDDING_DIMENSIONS):
+    """Persist the live version so restarts reconnect to the same index.
+
+    Retired versions still waiting to be deleted are carried over.
+    """
+    _write_live_state(user_id, {
+        "index_name": index_name,
+        "version": version,
+        "dimensions": dimensions,
+        "schema_version": INDEX_SCHEMA_VERSION,
+        "retired": load_live_state(user_id).get("retired", [])
+    })
+
+def retire_index(user_id, index_name, delete_after):
+    """Record a retired index version in the live state, to be deleted at ``delete_after`` (epoch seconds)."""
+    state = load_live_state(user_id)
+    retired = [entry for entry in state.get("retired", []) if entry["index_name"] != index_name]
+    retired.append({"index_name": index_name, "delete_after": delete_after})
+    state["retired"] = retired
+    _write_live_state(user_id, state)
+
+async def delete_search_index(index_name):
+    """Delete a search index and its local mirror; an index that is already gone counts as deleted."""
+    try:
+        await with_retries(lambda: get_async_search_index_client().delete_index(index_name), "index_gc")
+    except ResourceNotFoundError:
+        logger.info(f"Index already deleted: {index_name}")
+    get_index_catalog().discard(index_name)
+    delete_snapshot(index_name)
+
+async def collect_retired_indexes(user_id, delete_index=delete_search_index):
+    """Delete a user's retired index versions whose grace period has passed.
+
+    Deleted versions are dropped from the live state; failed ones stay for the next sweep.
+    Returns when the next retired version falls due, or None if none is waiting.
+    """
+    state = load_live_state(user_id)
+    now = time.time()
+    collected = set()
+    next_due = None
+    for entry in state.get("retired", []):
+        index_name = entry["index_name"]
+        if index_name == state.get("index_name"):
+            # Never delete the live index, even if it was once retired
+            collected.add(index_name)
+            continue
+        if entry["delete_after"] > now:
+            next_due = entry["delete_after"] if next_due is None else min(next_due, entry["delete_after"])
+            continue
+        try:
+            await delete_index(index_name)
+        except Exception as e:
+            logger.error(f"Error deleting retired index {index_name}: {str(e)}")
+            continue
+        logger.info(f"Garbage-collected retired index: {index_name}")
+        collected.add(index_name)
+
+    if collected:
+        # Re-read, so a swap recorded while deleting is not lost
+        state = load_live_state(user_id)
+        state["retired"] = [entry for entry in state.get("retired", []) if entry["index_name"] not in collected]
+        _write_live_state(user_id, state)
+    return next_due
+
+async def _collect_retired_indexes_after(user_id, delay, delete_index):
+    await asyncio.sleep(max(delay, 0))
+    next_due = await collect_retired_indexes(user_id, delete_index)
+    if next_due is not None:
+        schedule_index_gc(user_id, next_due - time.time(), delete_index)
+
+def schedule_index_gc(user_id, delay, delete_index=delete_search_index):
+    """Sweep a user's retired indexes after ``delay`` seconds.
+
+    The task is module-level so evicting the user's assistant does not cancel it; a restart
+    loses it, but the retired list is in the live state and swept again at startup.
+    """
+    task = asyncio.create_task(_collect_retired_indexes_after(user_id, delay, delete_index))
+    _gc_tasks.add(task)
+    task.add_done_callback(_gc_tasks.discard)
+
+def retire_after_grace(user_id, index_name, delete_index=delete_search_index):
+    """Retire an index version that was just swapped out; it is deleted once in-flight queries have drained."""
+    retire_index(user_id, index_name, time.time() + INDEX_GC_GRACE_SECONDS)
+    schedule_index_gc(user_id, INDEX_GC_GRACE_SECONDS, delete_index)
+
+async def sweep_retired_indexes(delete_index=delete_search_index):
+    """Delete retired indexes of every user whose grace period passed, and schedule the rest."""
+    try:
+        state_files = os.listdir(INDEX_SNAPSHOT_DIR)
+    except FileNotFoundError:
+        return
+    for file_name in state_files:
+        if not (file_name.startswith("inventory-") and file_name.endswith(".live.json")):
+            continue
+        user_id = file_name[len("inventory-"):-len(".live.json")]
+        try:
+            next_due = await collect_retired_indexes(user_id, delete_index)
+        except Exception as e:
+            logger.error(f"Error sweeping retired indexes of user {user_id}: {str(e)}")
+            continue
+        if next_due is not None:
+            schedule_index_gc(user_id, next_due - time.time(), delete_index)
+
+async def find_live_index(user_id):
+    """Resolve a user's live (index_name, version), or None if the user has no index.
+
+    The recorded live version is looked up directly; users without one are checked for the
+    legacy unversioned index. Only a missing index means "no index": other errors propagate,
+    so a transient failure is never taken for a user whose index must be built from scratch.
+    """
+    catalog = get_index_catalog()
+    
+    version = load_live_version(user_id)
+    if version is not None:
+        index_name = versioned_index_name(user_id, version)
+        if await catalog.exists(index_name):
+            return index_name, version
+    
+    index_name = versioned_index_name(user_id, 0)
+    if await catalog.exists(index_name):
+        return index_name, 0
+    return None
+
+# Per-document indexing statuses worth retrying; 422 means the index is temporarily unavailable
+RETRYABLE_KEY_STATUS_CODES = RETRYABLE_STATUS_CODES | {422}
+
+# Upper bound on the JSON size of one vector element: the longest float repr plus a separator
+VECTOR_ELEMENT_BYTES = 25
+
+def _payload_bytes(document):
+    """Serialized size of a document in an upload request.
+
+    Fields other than the vector are serialized exactly. The vector dominates the payload but is
+    bounded per element instead, since formatting its floats costs more than uploading them.
+    """
+    fields = {key: value for key, value in document.items() if key != 'content_vector'}
+    vector = document.get('content_vector')
+    size = len(json.dumps(fields, default=str, separators=(",", ":")).encode("utf-8"))
+    return size + (len(vector) if vector is not None else 0) * VECTOR_ELEMENT_BYTES
+
+def _upload_payload(document):
+    """The document as the service receives it; array vectors only become lists here, for JSON."""
+    vector = document['content_vector']
+    if isinstance(vector, np.ndarray):
+        return {**document, 'content_vector': vector.tolist()}
+    return document
+
+def _payload_batches(documents, max_bytes=SEARCH_UPLOAD_MAX_BYTES, max_documents=SEARCH_UPLOAD_MAX_DOCUMENTS):
+    """Group documents into upload batches under both the byte and document limits."""
+    batches = []
+    batch, batch_bytes = [], 0
+    for document in documents:
+        size = _payload_bytes(document)
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_documents):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(document)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
 class VectorStore:
     def __init__(self, user_id):
         logger.info(f"Initializing VectorStore for user {user_id}")
         self.user_id = user_id
-        self.credential = AzureKeyCredential(SEARCH_SERVICE_KEY)
-        self.index_name = f"inventory-{user_id}"
-        self.index_client = SearchIndexClient(
-            endpoint=SEARCH_SERVICE_ENDPOINT,
-            credential=self.credential
-        )
+        self.base_index_name = f"inventory-{user_id}"
+        self.version = 0
+        self.index_name = self.base_index_name
+        self.dimensions = EMBEDDING_DIMENSIONS
+        self.schema_version = INDEX_SCHEMA_VERSION
+        self.index_client = get_async_search_index_client()
+        self.catalog = get_index_catalog()
         self.search_client = None
+        self.rebuild = None
+        self.shadow_client = None
+        # Local mirrors of the live and shadow indexes, persisted as memory-mapped snapshots
+        self.local_index = None
+        self.shadow_local_index = None
+        # field -> distinct values of the live index, cleared whenever its documents change
+        self._field_values = {}
+
+    async def connect_to_live_index(self):
+        """Find the user's live index version and connect to it; False if the user has no index yet.
+
+        Lookup errors other than a missing index are raised rather than reported as no index.
+        """
+        live_index = await find_live_index(self.user_id)
+        if not live_index:
+            logger.info(f"No existing index found for: {self.base_index_name}")
+            return False
         
-        # Check if index already exists
-        try:
-            if self.index_name in list(self.index_client.list_index_names()):
-                logger.info(f"Found existing index: {self.index_name}")
-                self._connect_to_index()
-            else:
-                logger.info(f"No existing index found for: {self.index_name}")
-        except Exception as e:
-            logger.error(f"Error checking index existence: {str(e)}")
-    
+        self.index_name, self.version = live_index
+        self.dimensions, self.schema_version = load_live_schema(self.user_id, self.version)
+        logger.info(f"Found existing index: {self.index_name} ({self.dimensions} dimensions)")
+        self._connect_to_index()
+        self.local_index = LocalVectorIndex.open(self.index_name)
+        self._field_values = {}
+        return self.search_client is not None
+
+    def needs_migration(self):
+        """True if the live index was built with other vector dimensions or an older schema."""
+        return self.search_client is not None and (
+            self.dimensions != EMBEDDING_DIMENSIONS or self.schema_version != INDEX_SCHEMA_VERSION
+        )
+
+    def _versioned_name(self, version):
+        return versioned_index_name(self.user_id, version)
+
     def _connect_to_index(self):
         """Helper method to connect to an existing index."""
         try:
-            self.search_client = SearchClient(
-                endpoint=SEARCH_SERVICE_ENDPOINT,
-                credential=self.credential,
-                index_name=self.index_name
-            )
+            self.search_client = get_search_client(self.index_name)
             logger.info(f"Connected to existing index: {self.index_name}")
             return True
         except Exception as e:
             logger.error(f"Error connecting to index: {str(e)}")
             return False
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    def _build_index_definition(self, index_name):
+        """Build the search index schema for the given index name."""
+        # Configure vector search
+        vector_search = VectorSearch(
+            algorithms=[
+                HnswAlgorithmConfiguration(
+                    name="hnsw-config",
+                    kind="hnsw",
+                    parameters={
+                        "m": 4,
+                        "efConstruction": 400,
+                        "efSearch": 500,
+                        "metric": "cosine"
+                    }
+                )
+            ],
+            profiles=[
+                VectorSearchProfile(
+                    name="vector-profile",
+                    algorithm_configuration_name="hnsw-config"
+                )
+            ]
+        )
+
+        # Define fields with better naming and appropriate properties
+        fields = [
+            SimpleField(name="id", type="Edm.String", key=True),
+            SimpleField(name="userId", type="Edm.String", filterable=True),
+            SearchableField(name="supplier_name", type="Edm.String", filterable=True, searchable=True, sortable=True, facetable=True),
+            SearchableField(name="inventory_item_name", type="Edm.String", filterable=True, searchable=True, sortable=True),
+            SearchableField(name="item_name", type="Edm.String", filterable=True, searchable=True),
+            SearchableField(name="item_number", type="Edm.String", filterable=True, searchable=True),
+            SimpleField(name="quantity_in_case", type="Edm.Double", filterable=True, sortable=True),
+            SimpleField(name="total_units", type="Edm.Double", filterable=True, sortable=True),
+            SimpleField(name="case_price", type="Edm.Double", filterable=True, sortable=True),
+            SimpleField(name="cost_of_unit", type="Edm.Double", filterable=True, sortable=True),
+            SearchableField(name="category", type="Edm.String", filterable=True, searchable=True, sortable=True, facetable=True),
+            SearchableField(name="measured_in", type="Edm.String", filterable=True),
+            SimpleField(name="catch_weight", type="Edm.String", filterable=True),
+            SearchableField(name="priced_by", type="Edm.String", filterable=True),
+            SimpleField(name="splitable", type="Edm.String", filterable=True),
+            SearchableField(name="content", type="Edm.String", searchable=True),
+            SearchField(
+                name="content_vector",
+                type="Collection(Edm.Single)",
+                vector_search_dimensions=EMBEDDING_DIMENSIONS,  # Matches the configured embedding dimensions
+                vector_search_profile_name="vector-profile"
+            )
+        ]
+
+        logger.info(f"Creating new index with fields: {[f.name for f in fields]}")
+        
+        return SearchIndex(
+            name=index_name,
+            fields=fields,
+            vector_search=vector_search
+        )
+
     async def create_index(self):
-        """Create search index with retry logic."""
+        """Create search index, retrying transient service errors."""
         try:
             # Try to delete existing index
             try:
-                self.index_client.delete_index(self.index_name)
+                await self.index_client.delete_index(self.index_name)
+                self.catalog.discard(self.index_name)
                 logger.info(f"Deleted existing index: {self.index_name}")
             except Exception as e:
                 logger.info(f"No existing index to delete: {self.index_name}")
             
-            # Configure vector search
-            vector_search = VectorSearch(
-                algorithms=[
-                    HnswAlgorithmConfiguration(
-                        name="hnsw-config",
-                        kind="hnsw",
-                        parameters={
-                            "m": 4,
-                            "efConstruction": 400,
-                            "efSearch": 500,
-                            "metric": "cosine"
-                        }
-                    )
-                ],
-                profiles=[
-                    VectorSearchProfile(
-                        name="vector-profile",
-                        algorithm_configuration_name="hnsw-config"
-                    )
-                ]
-            )
-
-            # Define fields with better naming and appropriate properties
-            fields = [
-                SimpleField(name="id", type="Edm.String", key=True),
-                SimpleField(name="userId", type="Edm.String", filterable=True),
-                SearchableField(name="supplier_name", type="Edm.String", filterable=True, searchable=True, sortable=True),
-                SearchableField(name="inventory_item_name", type="Edm.String", filterable=True, searchable=True, sortable=True),
-                SearchableField(name="item_name", type="Edm.String", filterable=True, searchable=True),
-                SimpleField(name="item_number", type="Edm.String", filterable=True),
-                SimpleField(name="quantity_in_case", type="Edm.Double", filterable=True, sortable=True),
-                SimpleField(name="total_units", type="Edm.Double", filterable=True, sortable=True),
-                SimpleField(name="case_price", type="Edm.Double", filterable=True, sortable=True),
-                SimpleField(name="cost_of_unit", type="Edm.Double", filterable=True, sortable=True),
-                SearchableField(name="category", type="Edm.String", filterable=True, searchable=True, sortable=True),
-                SearchableField(name="measured_in", type="Edm.String", filterable=True),
-                SimpleField(name="catch_weight", type="Edm.String", filterable=True),
-                SearchableField(name="priced_by", type="Edm.String", filterable=True),
-                SimpleField(name="splitable", type="Edm.String", filterable=True),
-                SearchableField(name="content", type="Edm.String", searchable=True),
-                SearchField(
-                    name="content_vector",
-                    type="Collection(Edm.Single)",
-                    vector_search_dimensions=1536,  # Matches OpenAI's embedding dimensions
-                    vector_search_profile_name="vector-profile"
-                )
-            ]
-
-            logger.info(f"Creating new index with fields: {[f.name for f in fields]}")
-            
             # Create the index
-            index = SearchIndex(
-                name=self.index_name,
-                fields=fields,
-                vector_search=vector_search
-            )
-            
-            self.index_client.create_or_update_index(index)
+            index = self._build_index_definition(self.index_name)
+            await with_retries(lambda: self.index_client.create_or_update_index(index), "create_index")
+            self.catalog.add(self.index_name)
+            self.dimensions = EMBEDDING_DIMENSIONS
+            self.schema_version = INDEX_SCHEMA_VERSION
+            save_live_version(self.user_id, self.index_name, self.version)
             logger.info(f"Successfully created index: {self.index_name}")
             
             # Connect to the newly created index
             self._connect_to_index()
+            self.local_index = LocalVectorIndex(self.index_name)
+            self._field_values = {}
             return True
             
         except Exception as e:
             logger.error(f"Error creating index: {str(e)}")
             raise
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def add_documents(self, documents):
-        """Add documents to the index with improved error handling and retries."""
-        if not self.search_client:
+    async def _next_version(self):
+        """One past the newest version recorded live or present on the service.
+
+        Workers connected to an older version, or not connected at all, must not reuse the name
+        of an index another worker serves or is still building.
+        """
+        versions = [self.version]
+        live_version = load_live_version(self.user_id)
+        if live_version is not None:
+            versions.append(live_version)
+        pattern = user_index_pattern(self.user_id)
+        names = await self.catalog.names(refresh=True)
+        versions.extend(int(match.group(1) or 0) for match in map(pattern.match, names) if match)
+        return max(versions) + 1
+
+    async def begin_rebuild(self):
+        """Create an empty shadow index for the next version and return its name."""
+        version = await self._next_version()
+        index_name = self._versioned_name(version)
+        logger.info(f"Starting rebuild of {self.base_index_name} into shadow index {index_name}")
+        
+        index = self._build_index_definition(index_name)
+        await with_retries(lambda: self.index_client.create_or_update_index(index), "create_index")
+        self.catalog.add(index_name)
+        self.rebuild = {
+            "state": "building",
+            "index_name": index_name,
+            "version": version,
+            "total": 0,
+            "indexed": 0,
+            "started_at": time.time(),
+            "completed_at": None
+        }
+        self.shadow_client = get_search_client(index_name)
+        self.shadow_local_index = LocalVectorIndex(index_name)
+        return index_name
+
+    def set_rebuild_total(self, total):
+        """Record how many documents the running rebuild is expected to index."""
+        if self.rebuild:
+            self.rebuild["total"] = total
+
+    async def complete_rebuild(self):
+        """Atomically switch the live client to the shadow index and schedule cleanup of the old one."""
+        if not self.rebuild or self.rebuild["state"] != "building":
+            raise ValueError("No rebuild in progress")
+        
+        # The version this worker served, and the one recorded live if another worker swapped since
+        retired_index_names = {
+            self.index_name if self.search_client else None,
+            load_live_state(self.user_id).get("index_name")
+        }
+        
+        # A single reference assignment, so in-flight searches see either the old or the new index
+        self.search_client = self.shadow_client
+        self.shadow_client = None
+        self.local_index = self.shadow_local_index
+        self.shadow_local_index = None
+        self._field_values = {}
+        self.index_name = self.rebuild["index_name"]
+        self.version = self.rebuild["version"]
+        self.dimensions = EMBEDDING_DIMENSIONS
+        self.schema_version = INDEX_SCHEMA_VERSION
+        save_live_version(self.user_id, self.index_name, self.version)
+        
+        self.rebuild["state"] = "completed"
+        self.rebuild["completed_at"] = time.time()
+        logger.info(f"Swapped live index for {self.base_index_name} to {self.index_name}")
+        
+        for index_name in retired_index_names - {None, self.index_name}:
+            retire_after_grace(self.user_id, index_name)
+
+    async def abort_rebuild(self):
+        """Drop the shadow index of a failed rebuild, leaving the live index untouched."""
+        if not self.rebuild or self.rebuild["state"] != "building":
+            return
+        
+        index_name = self.rebuild["index_name"]
+        self.rebuild["state"] = "failed"
+        self.shadow_client = None
+        self.shadow_local_index = None
+        self.rebuild["completed_at"] = time.time()
+        logger.warning(f"Aborting rebuild into {index_name}")
+        if index_name == load_live_state(self.user_id).get("index_name"):
+            logger.error(f"Shadow index {index_name} is recorded live, keeping it")
+            return
+        try:
+            await self.index_client.delete_index(index_name)
+            self.catalog.discard(index_name)
+            delete_snapshot(index_name)
+        except Exception as e:
+            logger.error(f"Error deleting shadow index {index_name}: {str(e)}")
+
+    def rebuild_status(self):
+        """Report the live index and the progress of the latest rebuild."""
+        status = {
+            "live_index": self.index_name if self.search_client else None,
+            "live_version": self.version if self.search_client else None,
+            "live_dimensions": self.dimensions if self.search_client else None,
+            "rebuild": None
+        }
+        if self.rebuild:
+            status["rebuild"] = dict(self.rebuild)
+        return status
+
+    async def add_documents(self, documents, index_name=None):
+        """Upload documents concurrently in batches sized by payload bytes, retrying failed keys.
+
+        Documents go to the live index unless ``index_name`` names the shadow index of a running rebuild.
+        Returns the ids of the documents that were indexed.
+        """
+        rebuilding = bool(index_name and self.rebuild and self.rebuild["state"] == "building"
+                          and index_name == self.rebuild["index_name"])
+        if index_name and index_name != self.index_name and not rebuilding:
+            raise ValueError(f"Unknown target index: {index_name}")
+        
+        if not rebuilding and not self.search_client:
             logger.error("Search client not initialized")
             await self.connect_to_index()
             if not self.search_client:
                 raise ValueError("Failed to initialize search client")
         
+        search_client = self.shadow_client if rebuilding else self.search_client
+        local_index = self.shadow_local_index if rebuilding else self._current_local_index()
+        
         if not documents:
             logger.warning("No documents provided to add_documents")
             return []
@@ -163,16 +557,16 @@ class VectorStore:
                 try:
                     # Essential validation
                     if 'id' not in doc or not doc['id']:
-                        logger.warning(f"Document {i} missing id field, generating a new one")
+                        logger.warning(f"Document {i} missing id field, skipping")
                         continue
                         
-                    if 'content_vector' not in doc or not doc['content_vector']:
+                    if doc.get('content_vector') is None or len(doc['content_vector']) == 0:
                         logger.warning(f"Document {i} missing content_vector, skipping")
                         continue
                     
                     # Check vector dimensions
                     vector_dim = len(doc['content_vector'])
-                    if vector_dim != 1536:  # OpenAI embedding dimension
+                    if vector_dim != EMBEDDING_DIMENSIONS:
                         logger.warning(f"Document {i} has incorrect vector dimensions: {vector_dim}, skipping")
                         continue
                         
@@ -186,33 +580,157 @@ class VectorStore:
             if not validated_docs:
                 logger.error("No valid documents to upload after validation")
                 return []
-                
-            # Upload in batches to avoid request size limits
-            batch_size = 100
-            results = []
             
-            for i in range(0, len(validated_docs), batch_size):
-                batch = validated_docs[i:i+batch_size]
-                logger.info(f"Uploading batch {(i//batch_size)+1} with {len(batch)} documents")
-                
-                try:
-                    result = self.search_client.upload_documents(documents=batch)
-                    results.append(result)
-                    logger.info(f"Successfully uploaded batch {(i//batch_size)+1}")
-                except Exception as e:
-                    logger.error(f"Error uploading batch {(i//batch_size)+1}: {str(e)}")
-                    # Continue with next batch rather than failing completely
-                    
-            logger.info(f"Document upload complete. Total batches: {len(results)}")
-            return results
+            batches = _payload_batches(validated_docs)
+            logger.info(
+                f"Uploading {len(validated_docs)} documents in {len(batches)} batches "
+                f"(max {SEARCH_UPLOAD_MAX_BYTES} bytes, {SEARCH_UPLOAD_CONCURRENCY} in flight)"
+            )
+            semaphore = asyncio.Semaphore(max(1, SEARCH_UPLOAD_CONCURRENCY))
+            
+            async def upload(batch_number, batch):
+                indexed = await self._upload_batch(search_client, batch, batch_number, semaphore)
+                if indexed:
+                    indexed_docs = [doc for doc in batch if doc['id'] in indexed]
+                    if local_index is not None:
+                        local_index.upsert(indexed_docs)
+                    if rebuilding:
+                        self.rebuild["indexed"] += len(indexed_docs)
+                    else:
+                        self._field_values = {}
+                return indexed
+            
+            results = await asyncio.gather(
+                *(upload(n, batch) for n, batch in enumerate(batches, 1)), return_exceptions=True
+            )
+            indexed_ids = []
+            for batch_number, result in enumerate(results, 1):
+                # A cancelled batch comes back as CancelledError, which is not an Exception
+                if isinstance(result, BaseException):
+                    # Continue with other batches rather than failing completely
+                    logger.error(f"Error uploading batch {batch_number}: {str(result) or type(result).__name__}")
+                else:
+                    indexed_ids.extend(result)
+            
+            logger.info(f"Document upload complete: {len(indexed_ids)}/{len(validated_docs)} indexed")
+            return indexed_ids
             
         except Exception as e:
             logger.error(f"Error in add_documents: {str(e)}")
             raise
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def search(self, query_vector, top_k=5, filter_condition=None):
-        """Perform vector search with additional features and better error handling."""
+    async def _upload_batch(self, search_client, batch, batch_number, semaphore):
+        """Upload one batch and retry the keys the service reports as failed; return the indexed ids."""
+        indexed = set()
+        pending = batch
+        for attempt in range(SEARCH_UPLOAD_MAX_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(min(2 ** attempt, 10))
+            try:
+                async with semaphore:
+                    results = await search_client.upload_documents(documents=[_upload_payload(doc) for doc in pending])
+            except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+                if getattr(e, "status_code", None) == 413 and len(pending) > 1:
+                    # The size estimate was too low; split the batch and upload both halves
+                    middle = len(pending) // 2
+                    logger.warning(f"Batch {batch_number} too large, splitting into two")
+                    halves = await asyncio.gather(
+                        self._upload_batch(search_client, pending[:middle], batch_number, semaphore),
+                        self._upload_batch(search_client, pending[middle:], batch_number, semaphore)
+                    )
+                    return indexed.union(*halves)
+                if attempt == SEARCH_UPLOAD_MAX_RETRIES or not is_retryable(e):
+                    raise
+                record_retry("search_upload")
+                logger.warning(f"Error uploading batch {batch_number} (attempt {attempt + 1}): {str(e)}")
+                continue
+            
+            failed = {result.key: result for result in results if not result.succeeded}
+            indexed.update(result.key for result in results if result.succeeded)
+            if not failed:
+                break
+            logger.warning(
+                f"Batch {batch_number}: {len(failed)} documents failed to index "
+                f"(attempt {attempt + 1}), e.g. {next(iter(failed.values())).error_message}"
+            )
+            # Documents the service rejected (e.g. 400) fail the same way on every attempt
+            retryable = {key for key, result in failed.items() if result.status_code in RETRYABLE_KEY_STATUS_CODES}
+            if len(retryable) < len(failed):
+                logger.error(f"Batch {batch_number}: {len(failed) - len(retryable)} documents rejected, not retrying them")
+            pending = [doc for doc in pending if doc['id'] in retryable]
+            if not pending:
+                break
+            if attempt < SEARCH_UPLOAD_MAX_RETRIES:
+                record_retry("search_upload")
+        else:
+            logger.error(f"Batch {batch_number}: giving up on {len(pending)} documents after {SEARCH_UPLOAD_MAX_RETRIES} retries")
+        return indexed
+
+    def _current_local_index(self):
+        """Return the live local mirror, reopening it if another worker rewrote its snapshot."""
+        if self.local_index is not None and self.local_index.is_stale():
+            self.local_index = LocalVectorIndex.open(self.index_name)
+            self._field_values = {}
+        return self.local_index
+
+    async def persist_snapshot(self, index_name=None):
+        """Write the local mirror of the live index (or the named shadow index) to disk."""
+        local_index = self.shadow_local_index if index_name and index_name != self.index_name else self.local_index
+        if local_index is None:
+            # Indexes created before snapshots existed get one on their next full rebuild
+            logger.info(f"No local mirror for {index_name or self.index_name}, skipping vector snapshot")
+            return
+        await asyncio.to_thread(local_index.save)
+
+    async def field_values(self, field, limit=1000):
+        """Distinct values of a facetable field, used to recognise filter values in questions."""
+        if field in self._field_values:
+            return self._field_values[field]
+        local_index = self._current_local_index()
+        if local_index is not None:
+            values = local_index.field_values(field)
+        elif self.search_client:
+            async def facet_query():
+                results = await self.search_client.search(search_text="*", facets=[f"{field},count:{limit}"], top=0)
+                return await results.get_facets() or {}
+            facets = await with_retries(facet_query, "search_facets")
+            values = sorted(facet["value"] for facet in facets.get(field, []) if facet["value"])
+        else:
+            return []
+        self._field_values[field] = values
+        return values
+
+    def _search_snapshot(self, local_index, query_vector, top_k, filter_condition, query_text, order_by):
+        """Serve a query from the memory-mapped snapshot instead of the remote index."""
+        if order_by:
+            matches = local_index.ordered_search(order_by, top_k, filter_condition)
+        elif query_vector is None:
+            matches = local_index.keyword_search(query_text or "", top_k, filter_condition)
+        elif query_text:
+            matches = local_index.hybrid_search(query_vector, query_text, top_k, filter_condition)
+        else:
+            matches = local_index.search(query_vector, top_k, filter_condition)
+        results = []
+        for row, score in matches:
+            result = local_index.document(row, SEARCH_SELECT_FIELDS)
+            result["@search.score"] = score
+            results.append(result)
+        logger.info(f"Snapshot search returned {len(results)} results")
+        return results
+
+    async def search(self, query_vector, top_k=5, filter_condition=None, query_text=None, order_by=None):
+        """Perform vector search with additional features and better error handling.
+
+        With ``query_text`` the query is hybrid: BM25 over the keyword fields plus the vector
+        query, fused by the service with reciprocal rank fusion. With ``order_by`` the filtered
+        items are sorted by that field instead of ranked by relevance. Transient service errors
+        are retried within the current deadline.
+        """
+        if SEARCH_FROM_SNAPSHOT:
+            local_index = self._current_local_index()
+            if local_index is not None:
+                return self._search_snapshot(local_index, query_vector, top_k, filter_condition, query_text, order_by)
+
         if not self.search_client:
             logger.error("Search client not initialized")
             await self.connect_to_index()
@@ -220,45 +738,43 @@ class VectorStore:
                 raise ValueError("Failed to initialize search client")
                 
         try:
-            # Select fields to return in search results
-            select_fields = [
-                "inventory_item_name",
-                "item_name",
-                "category",
-                "case_price",
-                "cost_of_unit",
-                "total_units",
-                "measured_in",
-                "priced_by",
-                "content",
-                "supplier_name"
-            ]
-            
             # Prepare search options
             search_params = {
                 "search_text": None,
-                "vector_queries": [{
-                    'vector': query_vector,
-                    'fields': 'content_vector',
-                    'k': top_k,
-                    'kind': 'vector'
-                }],
-                "select": ",".join(select_fields),
+                "select": ",".join(SEARCH_SELECT_FIELDS),
                 "top": top_k
             }
             
+            if order_by:
+                # Ranking questions: sort the filtered slice rather than take the nearest vectors
+                search_params["search_text"] = "*"
+                search_params["order_by"] = [order_by]
+            else:
+                if query_text:
+                    search_params["search_text"] = query_text
+                    search_params["search_fields"] = KEYWORD_SEARCH_FIELDS
+                if query_vector is not None:
+                    search_params["vector_queries"] = [{
+                        'vector': np.asarray(query_vector, dtype=np.float32).tolist(),
+                        'fields': 'content_vector',
+                        'k': top_k,
+                        'kind': 'vector'
+                    }]
+                else:
+                    # No vector of the index's dimensions (pending migration): keyword search only
+                    search_params["search_text"] = query_text or "*"
+            
             # Add filter if provided
             if filter_condition:
                 search_params["filter"] = filter_condition
                 
             # Execute search
-            logger.info(f"Executing vector search with top_k={top_k}")
-            results = self.search_client.search(**search_params)
-            
-            # Process results
-            search_results = []
-            for result in results:
-                search_results.append(dict(result))
+            kind = "keyword" if query_vector is None else "hybrid" if query_text else "vector"
+            logger.info(f"Executing {kind} search with top_k={top_k}")
+            async def run_search():
+                results = await self.search_client.search(**search_params)
+                return [dict(result) async for result in results]
+            search_results = await with_retries(run_search, "search")
             
             logger.info(f"Search returned {len(search_results)} results")
             return search_results
@@ -271,11 +787,7 @@ class VectorStore:
         """Public method to connect to existing index with better error handling."""
         try:
             if not self.search_client:
-                self.search_client = SearchClient(
-                    endpoint=SEARCH_SERVICE_ENDPOINT,
-                    credential=self.credential,
-                    index_name=self.index_name
-                )
+                self.search_client = get_search_client(self.index_name)
                 logger.info(f"Connected to existing index: {self.index_name}")
             return True
         except Exception as e:
@@ -294,7 +806,13 @@ class VectorStore:
             
             # Delete documents
             logger.info(f"Deleting {len(docs_to_delete)} documents")
-            result = self.search_client.delete_documents(documents=docs_to_delete)
+            result = await with_retries(
+                lambda: self.search_client.delete_documents(documents=docs_to_delete), "delete_documents"
+            )
+            local_index = self._current_local_index()
+            if local_index is not None:
+                local_index.delete(document_ids)
+            self._field_values = {}
             
             logger.info(f"Documents deleted successfully")
             return result
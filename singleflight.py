@@ -0,0 +1,37 @@
+# singleflight.py
+import asyncio
+import logging
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("SingleFlight")
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight task."""
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def do(self, key, coro_factory):
+        """Run coro_factory() for key unless a call for key is already running, then await its result."""
+        task = self._in_flight.get(key)
+        if task is None:
+            logger.info(f"Starting single-flight task for {key}")
+            task = asyncio.ensure_future(coro_factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.info(f"Joining in-flight task for {key}")
+
+        # Shield the shared task so one caller being cancelled does not cancel it for everyone
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def in_flight(self, key):
+        return key in self._in_flight
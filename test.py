@@ -1,4 +1,8 @@
 import asyncio
+import time
+from types import SimpleNamespace
+import httpx
+import numpy as np
 from embeddings import EmbeddingGenerator
 
 async def test_embeddings():
@@ -22,5 +26,398 @@ async def test_embeddings():
     except Exception as e:
         print(f"Test failed with error: {str(e)}")
 
+class SlowChatStub:
+    """Stand-in for the chat completions API that takes a fixed time to answer."""
+    def __init__(self, latency):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=self)
+        self.with_raw_response = SimpleNamespace(create=self.create_raw)
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="stub answer")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def create_raw(self, **kwargs):
+        response = await self.create(**kwargs)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+class StubEmbeddingGenerator:
+    expected_dim = 1536
+
+    async def generate_embedding(self, text):
+        return np.full(1536, 0.1, dtype=np.float32)
+
+class StubVectorStore:
+    index_name = "inventory-stub"
+    dimensions = 1536
+
+    async def field_values(self, field):
+        return ["DAIRY"] if field == "category" else []
+
+    async def search(self, query_vector, top_k=5, filter_condition=None, query_text=None, order_by=None):
+        return [{"inventory_item_name": "Whole Milk", "category": "DAIRY", "content": "stub"}]
+
+def build_stub_assistant(user_id, latency):
+    """Build a RAGAssistant whose upstream services are in-process stubs."""
+    from rag import RAGAssistant
+    from answer_cache import SemanticAnswerCache
+    assistant = RAGAssistant.__new__(RAGAssistant)
+    assistant.user_id = user_id
+    assistant.answer_cache = SemanticAnswerCache()
+    assistant.embedding_generator = StubEmbeddingGenerator()
+    assistant.live_embedding_generator = None
+    assistant.vector_store = StubVectorStore()
+    assistant.openai_client = SlowChatStub(latency)
+    assistant.inventory_table = None
+    return assistant
+
+async def test_concurrent_queries(num_queries=10, latency=1.0):
+    """Verify simultaneous /query calls overlap instead of blocking the event loop"""
+    try:
+        print(f"\nStarting concurrency test with {num_queries} queries...")
+        import main
+        main.rag_assistants["concurrency-test"] = build_stub_assistant("concurrency-test", latency)
+        
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start_time = time.time()
+            responses = await asyncio.gather(*[
+                client.post("/query", json={"text": "How much milk do I have?", "user_id": "concurrency-test"})
+                for _ in range(num_queries)
+            ])
+            elapsed = time.time() - start_time
+        
+        assert all(r.status_code == 200 for r in responses), "Not all queries succeeded"
+        assert all(r.json()["response"] == "stub answer" for r in responses), "Unexpected responses"
+        
+        print("\nConcurrency test results:")
+        print(f"Stub latency: {latency:.2f}s, total time for {num_queries} queries: {elapsed:.2f}s")
+        assert elapsed < latency * 2, f"Queries ran sequentially ({elapsed:.2f}s for {num_queries} queries)"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+class CountingAssistant:
+    """Stand-in for RAGAssistant that counts index builds instead of calling Azure or OpenAI."""
+    builds = 0
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.vector_store = SimpleNamespace(
+            search_client=None, index_name=f"inventory-{user_id}-v1", needs_migration=lambda: False
+        )
+
+    async def connect(self):
+        return False
+
+    async def initialize(self):
+        CountingAssistant.builds += 1
+        await asyncio.sleep(0.5)
+        self.vector_store.search_client = object()
+
+async def test_single_flight_cold_queries(num_queries=50):
+    """Verify a burst of cold queries for one user triggers exactly one index build"""
+    try:
+        print(f"\nStarting single-flight test with {num_queries} cold queries...")
+        import main
+        user_id = "single-flight-test"
+        CountingAssistant.builds = 0
+        original_assistant, original_index_exists = main.RAGAssistant, main.index_exists
+
+        async def stub_index_exists(user_id):
+            return False
+
+        main.RAGAssistant, main.index_exists = CountingAssistant, stub_index_exists
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(*[
+                    client.post("/query", json={"text": "What's my cheapest dairy item?", "user_id": user_id})
+                    for _ in range(num_queries)
+                ])
+
+            # Wait for the background build to finish
+            for _ in range(100):
+                if user_id in main.rag_assistants:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            main.RAGAssistant, main.index_exists = original_assistant, original_index_exists
+
+        assert all(r.status_code == 200 for r in responses), "Not all queries succeeded"
+        assert user_id in main.rag_assistants, "Assistant was never registered"
+
+        print("\nSingle-flight test results:")
+        print(f"Index builds for {num_queries} concurrent cold queries: {CountingAssistant.builds}")
+        assert CountingAssistant.builds == 1, f"Expected exactly one index build, got {CountingAssistant.builds}"
+        print("\nTest completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+async def test_fast_path_lookups():
+    """Verify lookup questions are answered from the inventory table without a completion"""
+    try:
+        print("\nStarting fast path test...")
+        from inventory_table import InventoryTable
+        assistant = build_stub_assistant("fast-path-test", latency=1.0)
+        assistant.inventory_table = InventoryTable([
+            {"id": "milk", "inventory_item_name": "Whole Milk", "item_number": "7041235", "supplier_name": "Sysco",
+             "category": "DAIRY", "case_price": 32.5, "cost_of_unit": 8.125, "quantity_in_case": 4,
+             "total_units": 12, "measured_in": "gallons"},
+            {"id": "cheddar", "inventory_item_name": "Cheddar Cheese", "item_number": "7041236", "supplier_name": "Sysco",
+             "category": "DAIRY", "case_price": 45.0, "cost_of_unit": 3.75, "quantity_in_case": 12,
+             "total_units": 30, "measured_in": "lbs"},
+            {"id": "napkins", "inventory_item_name": "Paper Napkins", "item_number": "5500120", "supplier_name": "Uline",
+             "category": "PAPER", "case_price": 18.0, "cost_of_unit": 0.03, "quantity_in_case": 600,
+             "total_units": 1200, "measured_in": "each"},
+        ])
+        
+        questions = [
+            "How much is a case of whole milk?",
+            "What's the unit cost of item #7041236?",
+            "Total units of dairy?",
+            "What is my dairy inventory worth?",
+            "What's the cheapest dairy item per unit?",
+            "What is my Sysco inventory worth?",
+        ]
+        for question in questions:
+            start_time = time.time()
+            result = await assistant.query(question)
+            elapsed_ms = (time.time() - start_time) * 1000
+            print(f"{question} -> {result['response']} ({elapsed_ms:.2f} ms)")
+            assert result.get("fast_path"), f"Expected a fast path answer for: {question}"
+            assert elapsed_ms < 10, f"Fast path took {elapsed_ms:.2f} ms"
+        
+        # Questions the templates would answer wrongly go to the model
+        model_questions = [
+            "Why are my dairy costs going up?",
+            "What's the cheapest cheese?",
+            "How much did I spend with Sysco last month?",
+            "What's the total value of paper items if I double my order?",
+            "Total units of dairy excluding cheese?",
+            "How much is a case of whole milk and cheddar?",
+        ]
+        for question in model_questions:
+            result = await assistant.query(question)
+            assert not result.get("fast_path"), f"Expected the model to answer: {question} (got {result['response']!r})"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+async def test_query_deadline(deadline=0.5, latency=5.0):
+    """Verify a query whose completion outlasts the deadline fails fast with a 504"""
+    try:
+        print("\nStarting deadline test...")
+        import main
+        main.rag_assistants["deadline-test"] = build_stub_assistant("deadline-test", latency)
+        original_deadline = main.QUERY_DEADLINE_SECONDS
+        main.QUERY_DEADLINE_SECONDS = deadline
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                start_time = time.time()
+                response = await client.post("/query", json={"text": "How much milk do I have?", "user_id": "deadline-test"})
+                elapsed = time.time() - start_time
+                metrics = (await client.get("/metrics")).json()
+        finally:
+            # Later tests share the module and must run with the configured deadline
+            main.QUERY_DEADLINE_SECONDS = original_deadline
+        
+        print(f"Status: {response.status_code}, detail: {response.json().get('detail')}, elapsed: {elapsed:.2f}s")
+        assert response.status_code == 504, f"Expected a 504, got {response.status_code}"
+        assert elapsed < deadline + 0.5, f"Query ran past its deadline ({elapsed:.2f}s)"
+        assert metrics["upstream"]["deadline_exceeded"].get("completion"), "Timeout was not counted"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+def test_query_parser():
+    """Verify questions become the expected filters and sort orders"""
+    try:
+        print("\nStarting query parser test...")
+        from query_parser import parse_question
+        vocabulary = {"category": ["DAIRY", "PAPER", "OTHER", "PARTS"], "supplier_name": ["Sysco"]}
+        cases = [
+            ("Cheapest dairy from Sysco", "category eq 'DAIRY' and supplier_name eq 'Sysco'", "case_price asc"),
+            ("Most expensive item per unit", None, "cost_of_unit desc"),
+            ("What's running low?", None, "total_units asc"),
+            ("Dairy under $20", "category eq 'DAIRY' and case_price lt 20", None),
+            ("Cheese at most $12 a case", "case_price le 12", None),
+            ("Items no more than 3 dollars each", "cost_of_unit le 3", None),
+            ("Paper goods at least $5", "category eq 'PAPER' and case_price ge 5", None),
+            ("Anything between $5 and 10", "case_price ge 5 and case_price le 10", None),
+            # Amounts without a currency are not prices
+            ("Items over 100 units that are expensive", None, None),
+            # Categories named by everyday words only filter with a field cue
+            ("Any other cheese under $10?", "case_price lt 10", None),
+            ("What other items are cheapest?", None, "case_price asc"),
+            ("Do I have spare parts?", None, None),
+            ("Cheapest item in the Other category", "category eq 'OTHER'", "case_price asc"),
+        ]
+        for question, expected_filter, expected_order in cases:
+            plan = parse_question(question, vocabulary)
+            print(f"{question} -> filter={plan['filter']!r}, order_by={plan['order_by']!r}")
+            assert plan["filter"] == expected_filter, f"Unexpected filter for: {question}"
+            assert plan["order_by"] == expected_order, f"Unexpected sort order for: {question}"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+class RecordingVectorStore(StubVectorStore):
+    """Stub vector store that records searches and returns relevance-ranked candidates."""
+    def __init__(self):
+        self.calls = []
+
+    async def search(self, query_vector, top_k=5, filter_condition=None, query_text=None, order_by=None):
+        self.calls.append({
+            "filter": filter_condition,
+            "query_text": query_text,
+            "order_by": order_by,
+            "vector_dimensions": None if query_vector is None else len(query_vector)
+        })
+        return [
+            {"inventory_item_name": "Cheddar Cheese", "category": "DAIRY", "case_price": 45.0},
+            {"inventory_item_name": "String Cheese", "category": "DAIRY", "case_price": 28.0},
+            {"inventory_item_name": "Paper Napkins", "category": "PAPER", "case_price": 18.0},
+        ][:top_k]
+
+async def test_ranking_retrieval():
+    """Verify ranking questions sort a filtered slice, or the relevant items when nothing scopes them"""
+    try:
+        print("\nStarting ranking retrieval test...")
+        assistant = build_stub_assistant("ranking-test", latency=0)
+        assistant.vector_store = RecordingVectorStore()
+        
+        await assistant._retrieve("Cheapest dairy item", np.zeros(1536, dtype=np.float32), 2)
+        print(f"Scoped ranking: {assistant.vector_store.calls[-1]}")
+        assert assistant.vector_store.calls[-1]["order_by"] == "case_price asc", "Filtered slice was not sorted by the service"
+        
+        results = await assistant._retrieve("Cheapest cheese", np.zeros(1536, dtype=np.float32), 2)
+        print(f"Unscoped ranking: {assistant.vector_store.calls[-1]} -> {[r['inventory_item_name'] for r in results]}")
+        assert assistant.vector_store.calls[-1]["order_by"] is None, "Whole catalog was sorted without a filter"
+        assert assistant.vector_store.calls[-1]["query_text"] == "Cheapest cheese", "Ranking search ignored the question text"
+        assert [r["inventory_item_name"] for r in results] == ["String Cheese", "Cheddar Cheese"], "Relevant items were not sorted"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+class DimensionEmbeddingGenerator(StubEmbeddingGenerator):
+    """Stub generator for configurable dimensions; like the real one, it rejects sizes the model cannot produce."""
+    def __init__(self, dimensions=1536):
+        if not 0 < dimensions <= 1536:
+            raise ValueError(f"Unsupported embedding dimensions {dimensions}")
+        self.expected_dim = dimensions
+
+    async def generate_embedding(self, text):
+        return np.full(self.expected_dim, 0.1, dtype=np.float32)
+
+async def test_queries_during_migration():
+    """Verify queries keep matching the live index while a dimension migration is pending"""
+    try:
+        print("\nStarting pending migration test...")
+        import rag
+        assistant = build_stub_assistant("migration-test", latency=0)
+        assistant.vector_store = RecordingVectorStore()
+        original_generator = rag.EmbeddingGenerator
+        rag.EmbeddingGenerator = DimensionEmbeddingGenerator
+        try:
+            # The live index still holds 512-dimension vectors; new ones are 1536
+            assistant.vector_store.dimensions = 512
+            result = await assistant.query("How much milk do I have?")
+            print(f"Live 512-dimension index: {assistant.vector_store.calls[-1]} -> {result['response']!r}")
+            assert assistant.vector_store.calls[-1]["vector_dimensions"] == 512, "Question was not embedded for the live index"
+            assert result["response"] == "stub answer", "Query failed during the migration"
+            
+            # Dimensions no generator can produce fall back to keyword search
+            assistant.vector_store.dimensions = 3072
+            result = await assistant.query("How much cheese do I have?")
+            print(f"Live 3072-dimension index: {assistant.vector_store.calls[-1]} -> {result['response']!r}")
+            assert assistant.vector_store.calls[-1]["vector_dimensions"] is None, "Mismatched vector sent to the live index"
+            assert assistant.vector_store.calls[-1]["query_text"] == "How much cheese do I have?", "Keyword search was not used"
+            assert result["response"] == "stub answer", "Keyword-only query failed"
+        finally:
+            rag.EmbeddingGenerator = original_generator
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+def test_answer_cache_index_stamp():
+    """Verify answers cached before another worker re-indexed are treated as misses"""
+    try:
+        print("\nStarting answer cache stamp test...")
+        from answer_cache import SemanticAnswerCache
+        cache = SemanticAnswerCache()
+        embedding = np.full(1536, 0.1, dtype=np.float32)
+        before, after = ("inventory-test-v1", 1), ("inventory-test-v1", 2)
+        
+        cache.put("How much milk do I have?", embedding, "12 gallons", before)
+        assert cache.lookup_text("How much milk do I have?", before) == "12 gallons", "Expected a hit on the same index"
+        assert cache.lookup_text("How much milk do I have?", after) is None, "Stale answer served after re-indexing"
+        assert cache.lookup(embedding, after) is None, "Stale answer served by similarity after re-indexing"
+        
+        # An answer generated from the old index is not cached once the new one is seen
+        cache.put("How much cheese do I have?", embedding, "30 lbs", after)
+        cache.put("How much milk do I have?", embedding, "12 gallons", before)
+        assert cache.lookup_text("How much milk do I have?", after) is None, "Answer from the old index was cached"
+        assert cache.lookup_text("How much cheese do I have?", after) == "30 lbs", "Current answer was dropped"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
+async def test_rate_limit_priority():
+    """Verify interactive calls are served ahead of background calls already waiting for budget"""
+    try:
+        print("\nStarting rate limit priority test...")
+        from rate_limiter import RateLimitScheduler, INTERACTIVE, BACKGROUND
+        scheduler = RateLimitScheduler()
+        bucket = scheduler.bucket("priority-test")
+        # An empty budget refilling one request every 0.1s, with no reserve so only the order matters
+        bucket.request_limit, bucket.token_limit, bucket.reserve = 600, 1000000, 0.0
+        bucket.requests, bucket.tokens = 0.0, 1000000
+        served = []
+        
+        async def call(name, priority):
+            await scheduler.acquire("priority-test", 10, priority)
+            served.append(name)
+        
+        background = [asyncio.create_task(call(f"background-{i}", BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.02)
+        interactive = [asyncio.create_task(call(f"interactive-{i}", INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*background, *interactive)
+        
+        print(f"Served in order: {served}")
+        assert all(name.startswith("interactive") for name in served[:2]), "Background calls were served first"
+        print("\nTest completed successfully!")
+        
+    except Exception as e:
+        print(f"Test failed with error: {str(e)}")
+        raise
+
 if __name__ == "__main__":
-    asyncio.run(test_embeddings())
\ No newline at end of file
+    asyncio.run(test_embeddings())
+    asyncio.run(test_concurrent_queries())
+    asyncio.run(test_single_flight_cold_queries())
+    asyncio.run(test_fast_path_lookups())
+    asyncio.run(test_query_deadline())
+    test_query_parser()
+    asyncio.run(test_ranking_retrieval())
+    asyncio.run(test_queries_during_migration())
+    test_answer_cache_index_stamp()
+    asyncio.run(test_rate_limit_priority())
@@ -0,0 +1,104 @@
+# token_budget.py
+import logging
+import math
+from functools import lru_cache
+from config import OPENAI_MODEL, OPENAI_EMBEDDING_MODEL
+
+try:
+    import tiktoken
+except ImportError:  # Optional: exact token counts
+    tiktoken = None
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("TokenBudget")
+
+# Characters per token assumed without a tokenizer; low, so estimates err on the long side
+FALLBACK_CHARS_PER_TOKEN = 3
+
+# Encoding for models tiktoken does not know
+DEFAULT_ENCODING = "o200k_base"
+
+# Chat framing tokens added per message and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_PRIMER_TOKENS = 3
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """tiktoken encoding for a model, or None if tiktoken or its vocabulary files are unavailable.
+
+    Fine-tuned ids ("ft:base-model:org::id") use their base model's encoding.
+    """
+    if tiktoken is None:
+        return None
+    base_model = model.split(":")[1] if model.startswith("ft:") else model
+    try:
+        try:
+            return tiktoken.encoding_for_model(base_model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # Vocabulary files are downloaded on first use; offline hosts fall back to estimates
+        logger.warning(f"No tokenizer available for {model}, estimating token counts: {str(e)}")
+        return None
+
+def preload_encodings(models=(OPENAI_MODEL, OPENAI_EMBEDDING_MODEL)):
+    """Load (or fail to load) the encodings used on the query path, so no request waits on a download.
+
+    Blocking; run it in a worker thread at startup. Failures are cached as estimates too.
+    """
+    for model in models:
+        encoding = get_encoding(model)
+        logger.info(f"Token counts for {model}: {encoding.name if encoding else 'estimated'}")
+
+def count_tokens(text, model=OPENAI_MODEL):
+    """Number of tokens in text, or a conservative estimate without a tokenizer."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages, model=OPENAI_MODEL):
+    """Prompt tokens of a list of chat messages, including their framing."""
+    return sum(
+        count_tokens(message["content"], model) + MESSAGE_OVERHEAD_TOKENS for message in messages
+    ) + REPLY_PRIMER_TOKENS
+
+def truncate_tokens(text, max_tokens, model=OPENAI_MODEL):
+    """Cut text to at most max_tokens tokens. Returns (text, truncated)."""
+    # Every token covers at least one character, so short texts need no encoding
+    if len(text) <= max_tokens:
+        return text, False
+    encoding = get_encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * FALLBACK_CHARS_PER_TOKEN
+        return (text[:max_chars], True) if len(text) > max_chars else (text, False)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text, False
+    return encoding.decode(tokens[:max_tokens]), True
+
+def pack(blocks, budget, model=OPENAI_MODEL, separator="\n"):
+    """Keep blocks, in order, while they fit in a token budget. Returns (kept blocks, tokens used).
+
+    The first block is truncated rather than dropped, so the best match always reaches the prompt.
+    """
+    kept = []
+    used = 0
+    separator_tokens = count_tokens(separator, model) if separator else 0
+    for block in blocks:
+        tokens = count_tokens(block, model) + (separator_tokens if kept else 0)
+        if used + tokens > budget:
+            if not kept and budget > 0:
+                block, _ = truncate_tokens(block, budget, model)
+                kept.append(block)
+                used = count_tokens(block, model)
+            break
+        kept.append(block)
+        used += tokens
+    if len(kept) < len(blocks):
+        logger.info(f"Packed {len(kept)}/{len(blocks)} blocks into a {budget}-token budget")
+    return kept, used
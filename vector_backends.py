@@ -0,0 +1,41 @@
+# vector_backends.py
+from config import VECTOR_STORE_BACKEND
+from index_catalog import get_index_catalog
+from local_search import LocalVectorStore, find_live_local_index, sweep_retired_local_indexes
+from search import VectorStore, find_live_index, sweep_retired_indexes as sweep_retired_search_indexes
+
+# Vector store implementations sharing one interface:
+# connect_to_live_index, create_index, add_documents, search, delete_documents, connect_to_index,
+# begin_rebuild / complete_rebuild / abort_rebuild and rebuild_status
+BACKENDS = {
+    "azure": VectorStore,
+    "local": LocalVectorStore,
+}
+
+if VECTOR_STORE_BACKEND not in BACKENDS:
+    raise ValueError(
+        f"Unsupported vector store backend: {VECTOR_STORE_BACKEND}. "
+        f"Supported backends are: {list(BACKENDS.keys())}"
+    )
+
+def create_vector_store(user_id):
+    """Create the configured vector store for a user."""
+    return BACKENDS[VECTOR_STORE_BACKEND](user_id)
+
+async def user_index_exists(user_id, vector_store=None):
+    """Check whether a user has a live index, preferring an already connected store."""
+    if vector_store is not None and vector_store.search_client:
+        if VECTOR_STORE_BACKEND == "local":
+            return True
+        return await get_index_catalog().exists(vector_store.index_name)
+
+    if VECTOR_STORE_BACKEND == "local":
+        return find_live_local_index(user_id) is not None
+    return await find_live_index(user_id) is not None
+
+async def sweep_retired_indexes():
+    """Delete index versions retired before a restart once their grace period has passed."""
+    if VECTOR_STORE_BACKEND == "local":
+        await sweep_retired_local_indexes()
+    else:
+        await sweep_retired_search_indexes()
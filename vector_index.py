@@ -0,0 +1,383 @@
+# vector_index.py
+import asyncio
+import logging
+import numpy as np
+from config import LOCAL_HNSW_MIN_ITEMS, VECTOR_QUANTIZATION, QUANTIZATION_RERANK_FACTOR
+from odata_filter import parse_filter, evaluate_filter
+from hybrid import KEYWORD_SEARCH_FIELDS, BM25, tokenize, reciprocal_rank_fusion
+from quantization import (
+    validate_mode,
+    code_shape,
+    quantize_int8,
+    binary_codes,
+    int8_scores,
+    hamming_distances
+)
+from vector_snapshot import save_snapshot, open_snapshot, snapshot_version
+
+try:
+    import hnswlib
+except ImportError:  # Optional: approximate search for large tenants
+    hnswlib = None
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("LocalVectorIndex")
+
+# Fields of the Azure index definition, split by storage type. The long "content" text is
+# only searched remotely, so the mirror neither keeps it in memory nor writes it to disk.
+NUMERIC_FIELDS = ("quantity_in_case", "total_units", "case_price", "cost_of_unit")
+STRING_FIELDS = (
+    "id", "userId", "supplier_name", "inventory_item_name", "item_name", "item_number",
+    "category", "measured_in", "catch_weight", "priced_by", "splitable"
+)
+
+class LocalVectorIndex:
+    """One tenant's vectors in a contiguous float32 matrix with columnar fields for filtering.
+
+    With quantization enabled, searches scan compact int8 or binary codes and re-rank the
+    best candidates against the full-precision vectors, which can then stay memory-mapped.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, name, quantization=VECTOR_QUANTIZATION):
+        self.name = name
+        self.quantization = validate_mode(quantization)
+        self.size = 0
+        self.dimensions = None
+        self.vectors = None
+        self.ids = []
+        self.rows = {}
+        self.columns = {}
+        # Quantized codes (and int8 scales), row-aligned with the vectors
+        self.codes = None
+        self.scales = None
+        # Bumped on every write; a graph is only used while it matches the generation it was built from
+        self._generation = 0
+        self._hnsw = None
+        self._hnsw_generation = None
+        self._hnsw_build = None
+        self._keyword_index = None
+        self.snapshot_version = None
+
+    @classmethod
+    def open(cls, name):
+        """Open an index from its on-disk snapshot with the vectors memory-mapped, or None."""
+        snapshot = open_snapshot(name)
+        if snapshot is None:
+            return None
+
+        ids, vectors, columns, extras = snapshot
+        index = cls(name)
+        index.size = len(ids)
+        index.ids = list(ids)
+        index.rows = {doc_id: row for row, doc_id in enumerate(index.ids)}
+        if index.size:
+            index.dimensions = vectors.shape[1]
+            index.vectors = vectors
+            index.columns = {field: np.asarray(columns[field], dtype=np.float64) for field in NUMERIC_FIELDS}
+            index.columns.update({field: np.asarray(columns[field], dtype=object) for field in STRING_FIELDS})
+            if index.quantization != "none":
+                index._open_codes(extras)
+        index.snapshot_version = snapshot_version(name)
+        return index
+
+    def _open_codes(self, extras):
+        """Use the snapshot's codes for this mode, or encode the mapped vectors once."""
+        shape, dtype = code_shape(self.quantization, self.dimensions)
+        codes = extras.get(f"{self.quantization}_codes")
+        if codes is not None and codes.shape[1:] == shape and codes.dtype == dtype:
+            self.codes = codes
+            self.scales = extras.get("int8_scales")
+            return
+        logger.info(f"Encoding {self.size} vectors of {self.name} as {self.quantization} codes")
+        self.codes = np.zeros((self.size,) + shape, dtype=dtype)
+        self.scales = np.ones(self.size, dtype=np.float32) if self.quantization == "int8" else None
+        self._encode(np.arange(self.size), self.vectors)
+
+    def _encode(self, rows, vectors):
+        if self.quantization == "int8":
+            self.codes[rows], self.scales[rows] = quantize_int8(vectors)
+        elif self.quantization == "binary":
+            self.codes[rows] = binary_codes(vectors)
+
+    def save(self):
+        """Write this index to its on-disk snapshot and map its vectors from the new file.
+
+        Blocking; async callers run it in a worker thread once their writes have finished.
+        """
+        extras = {}
+        if self.size:
+            vectors = self.vectors[:self.size]
+            columns = {field: column[:self.size] for field, column in self.columns.items()}
+            if self.quantization != "none":
+                extras[f"{self.quantization}_codes"] = self.codes[:self.size]
+                if self.scales is not None:
+                    extras["int8_scales"] = self.scales[:self.size]
+        else:
+            vectors = np.zeros((0, self.dimensions or 0), dtype=np.float32)
+            columns = {}
+        vector_path = save_snapshot(self.name, self.ids, vectors, columns, extras=extras)
+        self.snapshot_version = snapshot_version(self.name)
+        if self.size:
+            # The page cache holds the vectors from here on, not the heap; later upserts copy on write
+            self.vectors = np.load(vector_path, mmap_mode="c")
+
+    def is_stale(self):
+        """True if another worker has rewritten this index's snapshot since it was opened or saved."""
+        on_disk = snapshot_version(self.name)
+        return on_disk is not None and on_disk != self.snapshot_version
+
+    def _allocate(self, capacity):
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        columns = {field: np.zeros(capacity, dtype=np.float64) for field in NUMERIC_FIELDS}
+        columns.update({field: np.full(capacity, "", dtype=object) for field in STRING_FIELDS})
+        if self.vectors is not None:
+            vectors[:self.size] = self.vectors[:self.size]
+            for field, column in self.columns.items():
+                columns[field][:self.size] = column[:self.size]
+        self.vectors = vectors
+        self.columns = columns
+
+        if self.quantization != "none":
+            shape, dtype = code_shape(self.quantization, self.dimensions)
+            codes = np.zeros((capacity,) + shape, dtype=dtype)
+            scales = np.ones(capacity, dtype=np.float32) if self.quantization == "int8" else None
+            if self.codes is not None:
+                codes[:self.size] = self.codes[:self.size]
+                if scales is not None:
+                    scales[:self.size] = self.scales[:self.size]
+            self.codes = codes
+            self.scales = scales
+
+    def upsert(self, documents):
+        """Insert or replace documents; vectors are stored L2-normalized for cosine scoring."""
+        if not documents:
+            return
+        if self.dimensions is None:
+            self.dimensions = len(documents[0]['content_vector'])
+            self._allocate(self.INITIAL_CAPACITY)
+
+        needed = self.size + sum(1 for doc in documents if doc['id'] not in self.rows)
+        if needed > len(self.vectors):
+            self._allocate(max(needed, 2 * len(self.vectors)))
+
+        rows = np.empty(len(documents), dtype=np.int64)
+        for i, doc in enumerate(documents):
+            row = self.rows.get(doc['id'])
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.rows[doc['id']] = row
+                self.ids.append(doc['id'])
+            rows[i] = row
+            for field in NUMERIC_FIELDS:
+                self.columns[field][row] = float(doc.get(field) or 0)
+            for field in STRING_FIELDS:
+                self.columns[field][row] = str(doc.get(field) or "")
+
+        # Normalize and store the whole batch at once
+        vectors = np.stack([np.asarray(doc['content_vector'], dtype=np.float32) for doc in documents])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors[rows] = vectors / np.where(norms > 0, norms, 1)
+        if self.codes is not None:
+            self._encode(rows, self.vectors[rows])
+
+        self._generation += 1
+        self._keyword_index = None
+
+    def delete(self, document_ids):
+        """Remove documents, moving the last row into each freed slot to stay contiguous."""
+        for doc_id in document_ids:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                moved_id = self.ids[last]
+                self.vectors[row] = self.vectors[last]
+                if self.codes is not None:
+                    self.codes[row] = self.codes[last]
+                    if self.scales is not None:
+                        self.scales[row] = self.scales[last]
+                for column in self.columns.values():
+                    column[row] = column[last]
+                self.ids[row] = moved_id
+                self.rows[moved_id] = row
+            self.ids.pop()
+            self.size -= 1
+        self._generation += 1
+        self._keyword_index = None
+
+    def _hnsw_index(self):
+        """The optional HNSW graph for large, unquantized tenants, or None while it is out of date.
+
+        Building a graph takes seconds for large tenants, so under an event loop it is built in a
+        worker thread and searches use the exact scan until it is ready.
+        """
+        if hnswlib is None or self.size < LOCAL_HNSW_MIN_ITEMS or self.codes is not None:
+            return None
+        if self._hnsw is not None and self._hnsw_generation == self._generation:
+            return self._hnsw
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to stall (scripts, worker threads): build in place
+            self._hnsw = self._build_hnsw(self.vectors, self.size)
+            self._hnsw_generation = self._generation
+            return self._hnsw
+        if self._hnsw_build is None:
+            self._hnsw_build = loop.create_task(self._build_hnsw_in_background())
+        return None
+
+    def _build_hnsw(self, vectors, size):
+        logger.info(f"Building HNSW graph for {self.name} with {size} vectors")
+        graph = hnswlib.Index(space="ip", dim=self.dimensions)
+        graph.init_index(max_elements=size, ef_construction=200, M=16)
+        graph.add_items(vectors[:size], np.arange(size))
+        return graph
+
+    async def _build_hnsw_in_background(self):
+        generation = self._generation
+        try:
+            graph = await asyncio.to_thread(self._build_hnsw, self.vectors, self.size)
+            # Writes during the build may have moved rows, so only a graph of the current rows is used
+            if generation == self._generation:
+                self._hnsw = graph
+                self._hnsw_generation = generation
+        except Exception as e:
+            logger.error(f"Error building HNSW graph for {self.name}: {str(e)}")
+        finally:
+            self._hnsw_build = None
+
+    def _filter_mask(self, filter_condition):
+        if not filter_condition:
+            return None
+        return evaluate_filter(parse_filter(filter_condition), self.columns, self.size)
+
+    def _keyword_scorer(self):
+        """Build (or rebuild after changes) the BM25 postings over the keyword fields."""
+        if self._keyword_index is None:
+            self._keyword_index = BM25([
+                [token for field in KEYWORD_SEARCH_FIELDS for token in tokenize(self.columns[field][row])]
+                for row in range(self.size)
+            ])
+        return self._keyword_index
+
+    def keyword_search(self, query_text, top_k=5, filter_condition=None):
+        """Return (row, BM25 score) pairs for rows matching any query term, best first."""
+        if self.size == 0:
+            return []
+        scores = self._keyword_scorer().scores(tokenize(query_text))
+        mask = self._filter_mask(filter_condition)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def hybrid_search(self, query_vector, query_text, top_k=5, filter_condition=None):
+        """Fuse vector and keyword rankings with reciprocal rank fusion; returns (row, fused score)."""
+        vector_rows = [row for row, _ in self.search(query_vector, top_k, filter_condition)]
+        keyword_rows = [row for row, _ in self.keyword_search(query_text, top_k, filter_condition)]
+        return reciprocal_rank_fusion([vector_rows, keyword_rows])[:top_k]
+
+    def ordered_search(self, order_by, top_k=5, filter_condition=None):
+        """Return (row, 1.0) pairs for the first top_k rows sorted by an OData ``field asc|desc`` clause."""
+        if self.size == 0:
+            return []
+        field, _, direction = order_by.partition(" ")
+        if field not in self.columns:
+            raise ValueError(f"Unknown sort field: {field}")
+
+        column = self.columns[field][:self.size]
+        rows = np.arange(self.size)
+        mask = self._filter_mask(filter_condition)
+        if mask is not None:
+            rows = rows[mask]
+        order = np.argsort(column[rows], kind="stable")
+        if direction.strip().lower() == "desc":
+            order = order[::-1]
+        return [(int(row), 1.0) for row in rows[order[:top_k]]]
+
+    def field_values(self, field):
+        """Distinct non-empty values of a string field."""
+        return sorted({value for value in self.columns.get(field, [])[:self.size] if value})
+
+    def search(self, query_vector, top_k=5, filter_condition=None, rerank_factor=QUANTIZATION_RERANK_FACTOR):
+        """Return (row, cosine similarity) pairs for the top_k matches, best first."""
+        if self.size == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = self._filter_mask(filter_condition)
+        if mask is not None and not mask.any():
+            return []
+
+        graph = self._hnsw_index()
+        if graph is not None:
+            graph.set_ef(max(64, 2 * top_k))
+            k = min(top_k, self.size if mask is None else int(mask.sum()))
+            try:
+                labels, distances = graph.knn_query(
+                    query, k=k, filter=(lambda label: bool(mask[label])) if mask is not None else None
+                )
+                return [(int(row), float(1.0 - distance)) for row, distance in zip(labels[0], distances[0])]
+            except RuntimeError:
+                # A sparse filter can leave the graph walk with fewer than k matches; scan the masked rows
+                logger.info(f"HNSW search found fewer than {k} filtered matches, using exact search")
+
+        if self.codes is not None:
+            return self._quantized_search(query, top_k, mask, rerank_factor)
+
+        # Exact search: one matrix-vector product over the tenant's contiguous vectors
+        scores = self.vectors[:self.size] @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            candidates = int(mask.sum())
+        else:
+            candidates = self.size
+
+        k = min(top_k, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def document(self, row, fields):
+        """Return the selected fields of a row as a search result dict."""
+        return {field: self.columns[field][row].item() if field in NUMERIC_FIELDS else self.columns[field][row]
+                for field in fields}
+
+    def _quantized_search(self, query, top_k, mask, rerank_factor):
+        """Scan the compact codes for candidates, then re-rank them with full-precision vectors."""
+        if self.quantization == "int8":
+            approximate = int8_scores(self.codes[:self.size], self.scales[:self.size], query)
+        else:
+            approximate = -hamming_distances(self.codes[:self.size], binary_codes(query)[0]).astype(np.float32)
+        if mask is not None:
+            approximate = np.where(mask, approximate, -np.inf)
+            candidates = int(mask.sum())
+        else:
+            candidates = self.size
+
+        shortlist = min(candidates, max(top_k, top_k * rerank_factor))
+        rows = np.argpartition(-approximate, shortlist - 1)[:shortlist]
+        rows.sort()  # Sequential reads from the mapped vector block
+
+        scores = self.vectors[rows] @ query
+        k = min(top_k, shortlist)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
@@ -0,0 +1,123 @@
+# vector_snapshot.py
+import json
+import logging
+import os
+import time
+import numpy as np
+from config import (
+    VECTOR_SNAPSHOT_DIR,
+    VECTOR_SNAPSHOT_DTYPE
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("VectorSnapshot")
+
+# On-disk layout per index:
+#   {index_name}.{generation}.npy  vector block (float32 or float16), memory-mapped on open
+#   {index_name}.{generation}.{name}.npy  optional extra row-aligned arrays (e.g. quantized codes)
+#   {index_name}.meta.json         names the current vector block, plus document ids and
+#                                  indexed field columns row-aligned with the vectors
+# Each save writes a new vector block and then swaps the sidecar, so readers always see a
+# consistent pair; workers that still map the previous block keep it alive until they reopen.
+
+def _meta_path(index_name, snapshot_dir):
+    return os.path.join(snapshot_dir, f"{index_name}.meta.json")
+
+def _read_meta(index_name, snapshot_dir):
+    try:
+        with open(_meta_path(index_name, snapshot_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def snapshot_exists(index_name, snapshot_dir=VECTOR_SNAPSHOT_DIR):
+    return os.path.exists(_meta_path(index_name, snapshot_dir))
+
+def snapshot_version(index_name, snapshot_dir=VECTOR_SNAPSHOT_DIR):
+    """Modification stamp of a snapshot, used to notice rewrites by other workers."""
+    try:
+        return os.stat(_meta_path(index_name, snapshot_dir)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _block_files(meta):
+    return [meta["vector_file"]] + list(meta.get("extra_files", {}).values())
+
+def save_snapshot(index_name, ids, vectors, columns, snapshot_dir=VECTOR_SNAPSHOT_DIR, dtype=VECTOR_SNAPSHOT_DTYPE,
+                  extras=None):
+    """Atomically write vectors, row-aligned field columns and optional extra arrays for one index.
+
+    Returns the path of the new vector block.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = _read_meta(index_name, snapshot_dir)
+
+    generation = time.time_ns()
+    vector_file = f"{index_name}.{generation}.npy"
+    vector_path = os.path.join(snapshot_dir, vector_file)
+    np.save(vector_path, np.ascontiguousarray(vectors, dtype=dtype))
+    extra_files = {}
+    for name, array in (extras or {}).items():
+        extra_files[name] = f"{index_name}.{generation}.{name}.npy"
+        np.save(os.path.join(snapshot_dir, extra_files[name]), np.ascontiguousarray(array))
+
+    meta_path = _meta_path(index_name, snapshot_dir)
+    tmp_meta_path = f"{meta_path}.tmp"
+    with open(tmp_meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "index_name": index_name,
+            "vector_file": vector_file,
+            "count": len(ids),
+            "dimensions": int(vectors.shape[1]) if len(ids) else None,
+            "dtype": dtype,
+            "extra_files": extra_files,
+            "ids": list(ids),
+            "columns": {field: column.tolist() for field, column in columns.items()}
+        }, f)
+    os.replace(tmp_meta_path, meta_path)
+
+    # Existing mappings of the old block stay valid after unlink
+    if previous:
+        for old_file in _block_files(previous):
+            old_path = os.path.join(snapshot_dir, old_file)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    logger.info(f"Saved vector snapshot for {index_name} with {len(ids)} vectors ({dtype})")
+    return vector_path
+
+def open_snapshot(index_name, snapshot_dir=VECTOR_SNAPSHOT_DIR):
+    """Open a snapshot; the vector block is memory-mapped (copy-on-write), not read into the heap.
+
+    Returns (ids, vectors, columns, extras) or None if there is no snapshot.
+    """
+    meta = _read_meta(index_name, snapshot_dir)
+    if meta is None:
+        return None
+
+    # Copy-on-write mapping: pages stay shared through the OS page cache until written
+    vectors = np.load(os.path.join(snapshot_dir, meta["vector_file"]), mmap_mode="c")
+    extras = {
+        name: np.load(os.path.join(snapshot_dir, extra_file), mmap_mode="c")
+        for name, extra_file in meta.get("extra_files", {}).items()
+    }
+    if len(vectors) != meta["count"] or any(len(array) != meta["count"] for array in extras.values()):
+        logger.error(f"Vector snapshot for {index_name} is inconsistent, ignoring it")
+        return None
+
+    logger.info(f"Opened vector snapshot for {index_name} with {meta['count']} vectors")
+    return meta["ids"], vectors, meta["columns"], extras
+
+def delete_snapshot(index_name, snapshot_dir=VECTOR_SNAPSHOT_DIR):
+    meta = _read_meta(index_name, snapshot_dir)
+    if meta is None:
+        return
+    for block_file in _block_files(meta):
+        block_path = os.path.join(snapshot_dir, block_file)
+        if os.path.exists(block_path):
+            os.remove(block_path)
+    os.remove(_meta_path(index_name, snapshot_dir))
+    logger.info(f"Deleted vector snapshot for {index_name}")